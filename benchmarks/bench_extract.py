@@ -0,0 +1,102 @@
+"""
+__INITIAL_STATE__提取基准测试
+对比逐字符括号扫描的旧实现与基于字节切片的新实现
+
+完整提取（extract_initial_state）的耗时以JSON解析为主：旧实现正则能直接匹配的页面上两者基本持平，
+只在旧实现退回逐字符扫描的页面上明显更快。普通页面上的提升来自parse_state_html默认使用的
+定向提取（extract_note_data），它只解析noteData子树，见最后两列。
+
+运行: python benchmarks/bench_extract.py
+"""
+import json
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from harness import timeit
+from pages import build_page
+from parser import extract_initial_state, extract_note_data
+
+
+# ============================================================================
+# 旧实现（仅作对比基准）
+# ============================================================================
+
+def legacy_extract_initial_state(html: str) -> dict:
+    """旧版提取函数：整页正则 + 逐字符括号扫描"""
+    pattern = r'window\.__INITIAL_STATE__\s*=\s*(\{.*?\})\s*</script>'
+    match = re.search(pattern, html, re.DOTALL)
+
+    if match:
+        json_str = match.group(1)
+        json_str = re.sub(r'\bundefined\b', 'null', json_str)
+        try:
+            return json.loads(json_str)
+        except json.JSONDecodeError:
+            pass
+
+    start_idx = html.find('window.__INITIAL_STATE__')
+    json_start = html.find('{', start_idx)
+    script_end = html.find('</script>', start_idx)
+    if script_end == -1:
+        script_end = len(html)
+
+    brace_count = 0
+    json_end = json_start
+    in_string = False
+    escape_next = False
+    in_single_quote = False
+
+    for i in range(json_start, script_end):
+        char = html[i]
+        if escape_next:
+            escape_next = False
+            continue
+        if char == '\\':
+            escape_next = True
+            continue
+        if char == '"' and not in_single_quote:
+            in_string = not in_string
+            continue
+        if char == "'" and not in_string:
+            in_single_quote = not in_single_quote
+            continue
+        if not in_string and not in_single_quote:
+            if char == '{':
+                brace_count += 1
+            elif char == '}':
+                brace_count -= 1
+                if brace_count == 0:
+                    json_end = i + 1
+                    break
+
+    json_str = re.sub(r'\bundefined\b', 'null', html[json_start:json_end])
+    return json.loads(json_str)
+
+
+# ============================================================================
+# 基准测试
+# ============================================================================
+
+def main():
+    print(f"{'页面大小':>10} {'路径':>6} {'旧实现(ms)':>12} {'新实现str(ms)':>14} "
+          f"{'新实现bytes(ms)':>16} {'加速比':>8} {'定向提取(ms)':>12} {'定向加速比':>10}")
+    for size, tricky in ((100_000, False), (1_000_000, False), (2_000_000, False),
+                         (100_000, True), (1_000_000, True), (2_000_000, True)):
+        html = build_page(size, tricky)
+        html_bytes = html.encode("utf-8")
+        assert extract_initial_state(html) == extract_initial_state(html_bytes)
+
+        legacy = timeit(legacy_extract_initial_state, html)
+        new_str = timeit(extract_initial_state, html)
+        new_bytes = timeit(extract_initial_state, html_bytes)
+        targeted = timeit(extract_note_data, html_bytes)
+        path = "扫描" if tricky else "正则"
+        print(f"{len(html_bytes):>10} {path:>6} {legacy * 1000:>12.2f} {new_str * 1000:>14.2f} "
+              f"{new_bytes * 1000:>16.2f} {legacy / new_bytes:>7.1f}x {targeted * 1000:>12.2f} {legacy / targeted:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
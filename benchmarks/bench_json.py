@@ -0,0 +1,45 @@
+"""
+JSON后端基准测试
+在合成页面（或命令行传入的已录制页面文件）上对比各已安装后端的解码耗时
+
+运行: python benchmarks/bench_json.py [page.html ...]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from harness import timeit
+from pages import build_page
+from parser import JSON_BACKENDS, extract_initial_state, extract_note_data
+
+
+def load_pages(paths: list[str]) -> list[tuple[str, bytes]]:
+    """读取录制的页面；未指定时使用不同大小的合成页面"""
+    if paths:
+        pages = []
+        for path in paths:
+            with open(path, "rb") as f:
+                pages.append((os.path.basename(path), f.read()))
+        return pages
+    return [(f"synthetic-{size // 1000}k", build_page(size).encode("utf-8"))
+            for size in (100_000, 1_000_000, 2_000_000)]
+
+
+def main():
+    pages = load_pages(sys.argv[1:])
+    backends = list(JSON_BACKENDS)
+    print(f"可用后端: {', '.join(backends)}")
+    print()
+    print(f"{'页面':>18} {'后端':>8} {'完整解析(ms)':>14} {'定向解析(ms)':>14}")
+    for name, html in pages:
+        expected = extract_initial_state(html, "json")
+        for backend in backends:
+            assert extract_initial_state(html, backend) == expected
+            full = timeit(lambda h: extract_initial_state(h, backend), html)
+            targeted = timeit(lambda h: extract_note_data(h, backend=backend), html)
+            print(f"{name:>18} {backend:>8} {full * 1000:>14.2f} {targeted * 1000:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
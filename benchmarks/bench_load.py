@@ -0,0 +1,122 @@
+"""
+parse_many压测
+在独立进程中启动本地模拟服务（或使用--server指定的已运行服务），
+通过XhsClient的base_urls把请求导向它，测量吞吐量、各阶段延迟和结果分布
+
+运行: python benchmarks/bench_load.py --requests 5000 --concurrency 200 --short-links 0.3
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parser import RetryPolicy, XhsClient, parse_many, trace_stages
+from stub_server import add_config_arguments, config_from_args, run
+
+SHORT_HOST = "xhslink.com"
+NOTE_HOST = "www.xiaohongshu.com"
+
+
+def build_urls(count: int, short_ratio: float) -> list[str]:
+    """生成互不相同的笔记链接，其中short_ratio比例为短链接，避免请求合并和缓存命中"""
+    short_every = round(1 / short_ratio) if short_ratio > 0 else 0
+    urls = []
+    for i in range(count):
+        if short_every and i % short_every == 0:
+            urls.append(f"http://{SHORT_HOST}/o/load{i}")
+        else:
+            urls.append(f"https://{NOTE_HOST}/explore/{i:024x}?xsec_token=load")
+    return urls
+
+
+def start_server(config, port: int) -> multiprocessing.Process:
+    """在子进程中启动模拟服务并等待端口可连接"""
+    process = multiprocessing.Process(target=run, args=(config, "127.0.0.1", port), daemon=True)
+    process.start()
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("模拟服务启动超时")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def load_test(server: str, urls: list[str], concurrency: int, retry: bool) -> tuple[float, Counter, dict]:
+    durations: dict[str, list[float]] = defaultdict(list)
+
+    def hook(event):
+        durations[event.stage].append(event.duration)
+
+    outcomes = Counter()
+    client = XhsClient(
+        limit=concurrency,
+        limit_per_host=concurrency,
+        retry=RetryPolicy() if retry else None,
+        base_urls={SHORT_HOST: server, NOTE_HOST: server},
+    )
+    async with client:
+        with trace_stages(hook):
+            start = time.perf_counter()
+            async for _, result in parse_many(urls, concurrency, client):
+                outcomes["ok" if isinstance(result, dict) else type(result).__name__] += 1
+            elapsed = time.perf_counter() - start
+    return elapsed, outcomes, durations
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--requests", type=int, default=2000)
+    arg_parser.add_argument("--concurrency", type=int, default=100)
+    arg_parser.add_argument("--short-links", type=float, default=0.0, help="短链接所占比例")
+    arg_parser.add_argument("--retry", action="store_true", help="启用默认重试策略")
+    arg_parser.add_argument("--server", help="已运行的模拟服务地址；不指定时自动启动")
+    add_config_arguments(arg_parser)
+    args = arg_parser.parse_args()
+
+    process = None
+    server = args.server
+    if server is None:
+        port = free_port()
+        process = start_server(config_from_args(args), port)
+        server = f"http://127.0.0.1:{port}"
+
+    try:
+        urls = build_urls(args.requests, args.short_links)
+        elapsed, outcomes, durations = asyncio.run(load_test(server, urls, args.concurrency, args.retry))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join()
+
+    print(f"{len(urls)}个链接，并发{args.concurrency}，耗时{elapsed:.2f}秒，{len(urls) / elapsed:.0f} 链接/秒")
+    print("结果: " + ", ".join(f"{name}={count}" for name, count in outcomes.most_common()))
+    print(f"{'阶段':>10} {'次数':>8} {'p50(ms)':>10} {'p90(ms)':>10} {'p99(ms)':>10}")
+    for stage, values in durations.items():
+        print(f"{stage:>10} {len(values):>8} {percentile(values, 0.5) * 1000:>10.2f} "
+              f"{percentile(values, 0.9) * 1000:>10.2f} {percentile(values, 0.99) * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+解析器基准测试
+在small/typical/large（约5 MB）三档合成笔记页上测量提取与清理函数的吞吐量和峰值内存，
+可保存基线并与之对比
+
+运行:
+    python benchmarks/bench_parser.py --save main
+    python benchmarks/bench_parser.py --compare main
+
+baselines/reference.json为随仓库提供的参考基线（记录了生成时的Python版本和平台），
+在其他机器上应先用--save生成本机基线再对比。
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from harness import load_baseline, measure, report, save_baseline
+from pages import PAGE_SIZES, build_note, build_page
+from parser import clean_share_url, clean_topic_tags, extract_initial_state, extract_note_data, parse_note_data
+
+SHARE_URLS = (
+    "https://www.xiaohongshu.com/discovery/item/6911c27f0000000003018875?source=webshare&xhsshare=pc_web"
+    "&xsec_token=ABdFQJUhxKcZsFTj638F7Q905jLk-jViDfdTPzdcgla5E=&xsec_source=pc_share",
+    "https://www.xiaohongshu.com/explore/69091715000000000700ad79?xsec_token=AB9ZqpaV0h9imneex7Gx1dFsVvzyoFTw3TJOl4tt5NuLo="
+    "&xsec_source=pc_feed",
+)
+
+DESCS = {
+    "short": "#旅行[话题]# 周末去哪儿",
+    "long": "".join(f"第{i}段 #话题{i}[话题]# 正文内容，{{不是标签}} #不完整[话题 " for i in range(200)),
+}
+
+
+def build_cases() -> dict[str, tuple]:
+    """返回 {用例名: (函数, 参数)}"""
+    cases = {}
+    for profile, size in PAGE_SIZES.items():
+        html = build_page(size)
+        html_bytes = html.encode("utf-8")
+        expected = build_note()["title"]
+        assert extract_initial_state(html_bytes)["noteData"]["data"]["noteData"]["title"] == expected
+        assert extract_note_data(html)["title"] == expected
+        cases[f"extract_initial_state/str/{profile}"] = (extract_initial_state, html)
+        cases[f"extract_initial_state/bytes/{profile}"] = (extract_initial_state, html_bytes)
+        cases[f"extract_note_data/bytes/{profile}"] = (extract_note_data, html_bytes)
+
+    for note_type in ("normal", "video"):
+        state = {"noteData": {"data": {"noteData": build_note(note_type=note_type)}}}
+        cases[f"parse_note_data/{note_type}"] = (parse_note_data, state)
+    for name, desc in DESCS.items():
+        cases[f"clean_topic_tags/{name}"] = (clean_topic_tags, desc)
+    cases["clean_share_url/discovery"] = (clean_share_url, SHARE_URLS[0])
+    cases["clean_share_url/explore"] = (clean_share_url, SHARE_URLS[1])
+    return cases
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--min-time", type=float, default=1.0, help="每个用例的最短计时（秒）")
+    arg_parser.add_argument("--filter", default="", help="只运行名称包含该字符串的用例")
+    arg_parser.add_argument("--save", metavar="NAME", help="把本次结果保存为基线")
+    arg_parser.add_argument("--compare", metavar="NAME", help="与已保存的基线对比")
+    arg_parser.add_argument("--threshold", type=float, default=0.1, help="吞吐量下降超过该比例视为退化")
+    args = arg_parser.parse_args()
+
+    results = {}
+    for name, (func, arg) in build_cases().items():
+        if args.filter in name:
+            results[name] = measure(func, arg, args.min_time)
+
+    baseline = load_baseline(args.compare) if args.compare else None
+    regressions = report(results, baseline, args.threshold)
+    if args.save:
+        print(f"\n基线已保存: {save_baseline(args.save, results)}")
+    if regressions:
+        print(f"\n{len(regressions)}个用例吞吐量下降超过{args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+基准测试工具
+计时（ops/sec）、峰值内存（tracemalloc）以及基线的保存与对比
+"""
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+
+def timeit(func, arg, min_time: float = 1.0) -> float:
+    """返回单次调用的平均耗时（秒）"""
+    func(arg)
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        func(arg)
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / runs
+
+
+def peak_memory(func, arg) -> int:
+    """返回单次调用期间新分配内存的峰值（字节）"""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        func(arg)
+        return tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+
+def measure(func, arg, min_time: float = 1.0) -> dict:
+    """计时并测量峰值内存；内存单独测一次，避免tracemalloc拖慢计时"""
+    seconds = timeit(func, arg, min_time)
+    return {"ops_per_sec": 1 / seconds, "mean_ms": seconds * 1000, "peak_kib": peak_memory(func, arg) / 1024}
+
+
+def baseline_path(name: str) -> str:
+    """基线名为路径时原样使用，否则保存在benchmarks/baselines/<name>.json"""
+    if os.sep in name or name.endswith(".json"):
+        return name
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def save_baseline(name: str, results: dict[str, dict]) -> str:
+    """保存本次结果作为基线，返回文件路径"""
+    path = baseline_path(name)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    data = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def load_baseline(name: str) -> dict[str, dict]:
+    with open(baseline_path(name), encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+
+def report(results: dict[str, dict], baseline: dict[str, dict] | None = None, threshold: float = 0.1) -> list[str]:
+    """打印结果表，有基线时附带变化比例；返回吞吐量下降超过threshold的用例名"""
+    width = max(len(name) for name in results)
+    header = f"{'用例':<{width}} {'ops/sec':>12} {'平均(ms)':>10} {'峰值内存(KiB)':>14}"
+    if baseline is not None:
+        header += f" {'吞吐变化':>9} {'内存变化':>9}"
+    print(header)
+
+    regressions = []
+    for name, result in results.items():
+        line = (f"{name:<{width}} {result['ops_per_sec']:>12.1f} {result['mean_ms']:>10.3f} "
+                f"{result['peak_kib']:>14.1f}")
+        base = baseline.get(name) if baseline is not None else None
+        if base is not None:
+            speed = result["ops_per_sec"] / base["ops_per_sec"] - 1
+            memory = result["peak_kib"] / base["peak_kib"] - 1 if base["peak_kib"] else 0.0
+            line += f" {speed:>+9.1%} {memory:>+9.1%}"
+            if speed < -threshold:
+                regressions.append(name)
+                line += "  退化"
+        elif baseline is not None:
+            line += f" {'新增':>9}"
+        print(line)
+    return regressions
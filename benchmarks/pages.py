@@ -0,0 +1,105 @@
+"""
+合成笔记页生成
+按真实笔记页的结构生成HTML：noteData之外附带体积较大的无关store，
+字符串中包含括号、引号、转义、单引号等干扰字符，空值以undefined形式出现
+"""
+import json
+
+# 各档页面中__INITIAL_STATE__的大致字节数
+PAGE_SIZES = {
+    "small": 20_000,
+    "typical": 300_000,
+    "large": 5_000_000,
+}
+
+# 字符串内容中的干扰字符：括号、转义引号、单引号、看似undefined的文本和HTML片段
+TRICKY_TEXTS = (
+    "标题 {不是括号} [也不是] \"引号\"",
+    "it's 小红书's '单引号' 和落单的'",
+    "转义 \\\" 反斜杠 \\\\ 结尾\\",
+    "undefined 不应被替换, undefined}",
+    "<div class=\"card\">{{ template }}</div>",
+)
+
+
+def build_note(note_id: str = "6911c27f0000000003018875", note_type: str = "normal", image_count: int = 9) -> dict:
+    """生成noteData.data.noteData子对象"""
+    note = {
+        "noteId": note_id,
+        "type": note_type,
+        "title": TRICKY_TEXTS[0],
+        "desc": "#旅行[话题]# #美食[话题]# " + TRICKY_TEXTS[1] + " #周末去哪儿[话题]#",
+        "user": {"nickName": "用户'昵称", "userId": "5f0000000000000001000001", "avatar": None},
+        "time": 1700000000000,
+        "lastUpdateTime": None,
+        "interactInfo": {"likedCount": "1.2万", "collectedCount": "3456", "commentCount": "789"},
+        "tagList": [{"id": str(i), "name": f"标签{i}", "type": "topic"} for i in range(5)],
+    }
+    if note_type == "video":
+        note["video"] = {
+            "media": {
+                "stream": {
+                    "h264": [{"masterUrl": "http://sns-video-bd.xhscdn.com/stream/110/258/01e9.mp4", "backupUrls": []}],
+                    "h265": [],
+                },
+                "videoId": None,
+            },
+        }
+        note["imageList"] = [{"url": "//sns-webpic-qc.xhscdn.com/cover", "infoList": None}]
+    else:
+        note["imageList"] = [
+            {"url": f"//sns-webpic-qc.xhscdn.com/202401/{i:04d}!nd_dft_wlteh_webp_3", "width": 1080, "height": 1440,
+             "livePhoto": False, "stream": None}
+            for i in range(image_count)
+        ]
+    return note
+
+
+def _feed_item(i: int) -> dict:
+    """无关store中的一条记录，混入各类干扰字符串"""
+    return {
+        "id": f"{i:024x}",
+        "displayTitle": TRICKY_TEXTS[i % len(TRICKY_TEXTS)],
+        "user": {"nickName": f"用户{i}", "avatar": None},
+        "cover": {"url": f"//sns-webpic-qc.xhscdn.com/feed/{i}", "infoList": [{"imageScene": "WB_DFT", "url": None}]},
+        "interactInfo": {"liked": False, "likedCount": str(i % 1000)},
+        "extra": None,
+    }
+
+
+def build_state(target_size: int, note: dict | None = None) -> dict:
+    """生成完整的__INITIAL_STATE__对象，用多个无关store把体积填充到约target_size字节"""
+    state = {
+        "global": {"appSettings": {"notificationInterval": 30, "prefix": "'"}, "serverTime": None},
+        "user": {"loggedIn": False, "userInfo": None},
+        "noteData": {"data": {"noteData": note if note is not None else build_note()}, "normalNotePreloadData": None},
+        "feed": {"feeds": [], "cursor": None},
+        "search": {"searchContext": {"keyword": "{关键词}"}, "feeds": []},
+        "comment": {"comments": []},
+    }
+    item_size = len(json.dumps(_feed_item(0), ensure_ascii=False).encode())
+    count = max(1, (target_size - len(json.dumps(state, ensure_ascii=False).encode())) // item_size)
+    stores = (state["feed"]["feeds"], state["search"]["feeds"], state["comment"]["comments"])
+    for i in range(count):
+        stores[i % len(stores)].append(_feed_item(i))
+    return state
+
+
+def build_page(target_size: int, tricky: bool = True, note: dict | None = None) -> str:
+    """生成结构类似笔记页的HTML，state体积约为target_size字节
+
+    空值统一写成undefined；tricky为True时在对象后追加分号（与部分线上页面一致），
+    使旧实现的正则路径失配，退回逐字符扫描。
+    """
+    js = json.dumps(build_state(target_size, note), ensure_ascii=False).replace("null", "undefined")
+    if tricky:
+        js += ";"
+    head = "".join(f'<meta name="m{i}" content="{{x}}">' for i in range(50))
+    return (
+        f"<html><head><title>note</title>{head}</head><body>"
+        "<div id=\"app\"><div class=\"note-container\">'</div></div>"
+        "<script>window.__SETUP__={a:1}</script>"
+        "<script>window.__INITIAL_STATE__=" + js + "</script>"
+        "<script>window.__SSR__=true</script></body></html>"
+    )
+
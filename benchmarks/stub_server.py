@@ -0,0 +1,200 @@
+"""
+本地模拟服务
+模拟xhslink.com短链接302重定向和带__INITIAL_STATE__的笔记页，
+可配置延迟分布、错误率、限流响应和慢速分块返回，用于不依赖网络的压测
+
+运行: python benchmarks/stub_server.py --port 8080 --latency lognormal:0.02,0.5 --error-rate 0.01
+客户端: XhsClient(base_urls={"xhslink.com": "http://127.0.0.1:8080",
+                              "www.xiaohongshu.com": "http://127.0.0.1:8080"})
+"""
+import argparse
+import asyncio
+import hashlib
+import math
+import os
+import random
+import sys
+from collections import Counter
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pages import PAGE_SIZES, build_note, build_page
+
+NOTE_HOST = "https://www.xiaohongshu.com"
+LATENCY_KINDS = ("fixed", "uniform", "exp", "lognormal")
+
+
+def parse_latency(spec: str) -> tuple[str, tuple[float, ...]]:
+    """解析延迟分布（秒）
+
+    "0.02"或"fixed:0.02"为固定值；"uniform:最小,最大"；"exp:均值"；"lognormal:中位数,sigma"。
+    """
+    kind, _, params = spec.partition(":")
+    if not params:
+        kind, params = "fixed", kind
+    if kind not in LATENCY_KINDS:
+        raise ValueError(f"未知的延迟分布: {kind}")
+    return kind, tuple(float(x) for x in params.split(","))
+
+
+class StubConfig:
+    """模拟服务的行为配置
+
+    error_rate: 返回503的比例；throttle_rate: 返回throttle_status的比例；
+    drip_rate: 笔记页按drip_chunk字节分块、每块间隔drip_delay秒慢速返回的比例。
+    """
+
+    def __init__(
+        self,
+        latency: str = "0",
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        throttle_status: int = 461,
+        drip_rate: float = 0.0,
+        drip_chunk: int = 4096,
+        drip_delay: float = 0.01,
+        page_size: str = "typical",
+        seed: int | None = None,
+    ):
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.throttle_status = throttle_status
+        self.drip_rate = drip_rate
+        self.drip_chunk = drip_chunk
+        self.drip_delay = drip_delay
+        self.page_size = page_size
+        self.seed = seed
+
+
+class StubServer:
+    """模拟服务的请求处理；页面在启动时生成一次，请求时只做随机决策"""
+
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        size = PAGE_SIZES[config.page_size]
+        self.pages = [
+            build_page(size, note=build_note(note_type=note_type)).encode("utf-8")
+            for note_type in ("normal", "video")
+        ]
+        self.stats = Counter()
+
+    def delay(self) -> float:
+        kind, params = self.config.latency
+        if kind == "fixed":
+            return params[0]
+        if kind == "uniform":
+            return self.random.uniform(*params)
+        if kind == "exp":
+            return self.random.expovariate(1 / params[0]) if params[0] > 0 else 0.0
+        median, sigma = params
+        return self.random.lognormvariate(math.log(median), sigma)
+
+    async def fault(self) -> web.Response | None:
+        """模拟延迟，并按比例返回错误或限流响应"""
+        delay = self.delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        roll = self.random.random()
+        if roll < self.config.error_rate:
+            self.stats["error"] += 1
+            return web.Response(status=503, text="service unavailable")
+        if roll < self.config.error_rate + self.config.throttle_rate:
+            self.stats["throttled"] += 1
+            return web.Response(status=self.config.throttle_status, text="too many requests")
+        return None
+
+    async def short_link(self, request: web.Request) -> web.Response:
+        response = await self.fault()
+        if response is not None:
+            return response
+        self.stats["redirect"] += 1
+        code = request.match_info["code"]
+        note_id = hashlib.md5(code.encode()).hexdigest()[:24]
+        location = f"{NOTE_HOST}/discovery/item/{note_id}?source=webshare&xhsshare=pc_web&xsec_token={code}"
+        return web.Response(status=302, headers={"Location": location})
+
+    async def note_page(self, request: web.Request) -> web.StreamResponse:
+        response = await self.fault()
+        if response is not None:
+            return response
+        note_id = request.match_info["note_id"]
+        body = self.pages[int(hashlib.md5(note_id.encode()).hexdigest(), 16) % len(self.pages)]
+        if self.random.random() >= self.config.drip_rate:
+            self.stats["page"] += 1
+            return web.Response(body=body, content_type="text/html", charset="utf-8")
+
+        self.stats["drip"] += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/html; charset=utf-8"})
+        response.content_length = len(body)
+        await response.prepare(request)
+        chunk = self.config.drip_chunk
+        for start in range(0, len(body), chunk):
+            await response.write(body[start:start + chunk])
+            await asyncio.sleep(self.config.drip_delay)
+        await response.write_eof()
+        return response
+
+    async def stats_view(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.stats))
+
+
+def make_app(config: StubConfig | None = None) -> web.Application:
+    """创建模拟服务应用：/o/{code}为短链接，/explore/{note_id}与/discovery/item/{note_id}为笔记页"""
+    server = StubServer(config if config is not None else StubConfig())
+    app = web.Application()
+    app["stub"] = server
+    app.router.add_get("/o/{code}", server.short_link)
+    app.router.add_get("/explore/{note_id}", server.note_page)
+    app.router.add_get("/discovery/item/{note_id}", server.note_page)
+    app.router.add_get("/__stats", server.stats_view)
+    return app
+
+
+def run(config: StubConfig, host: str = "127.0.0.1", port: int = 8080):
+    """在当前进程中运行模拟服务直到被中断"""
+    web.run_app(make_app(config), host=host, port=port, print=None, access_log=None)
+
+
+def add_config_arguments(arg_parser: argparse.ArgumentParser):
+    """向命令行解析器添加StubConfig的参数，供压测脚本复用"""
+    arg_parser.add_argument("--latency", default="0", help='延迟分布，如"0.02"、"uniform:0.01,0.05"、"lognormal:0.02,0.5"')
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="返回503的比例")
+    arg_parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回限流状态码的比例")
+    arg_parser.add_argument("--throttle-status", type=int, default=461)
+    arg_parser.add_argument("--drip-rate", type=float, default=0.0, help="慢速分块返回页面的比例")
+    arg_parser.add_argument("--drip-chunk", type=int, default=4096)
+    arg_parser.add_argument("--drip-delay", type=float, default=0.01)
+    arg_parser.add_argument("--page-size", choices=list(PAGE_SIZES), default="typical")
+    arg_parser.add_argument("--seed", type=int)
+
+
+def config_from_args(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        throttle_status=args.throttle_status,
+        drip_rate=args.drip_rate,
+        drip_chunk=args.drip_chunk,
+        drip_delay=args.drip_delay,
+        page_size=args.page_size,
+        seed=args.seed,
+    )
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8080)
+    add_config_arguments(arg_parser)
+    args = arg_parser.parse_args()
+    print(f"模拟服务: http://{args.host}:{args.port}")
+    run(config_from_args(args), args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
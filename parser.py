@@ -1,21 +1,1826 @@
 """
 小红书链接解析器
 统一使用移动端UA和JSON解析路径
+
+需要Python 3.11及以上：定位__INITIAL_STATE__的正则使用了占有量词，
+超时控制使用asyncio.timeout，后台刷新使用带context参数的create_task。
 """
+import sys
+
+if sys.version_info < (3, 11):
+    raise ImportError("小红书链接解析器需要Python 3.11及以上版本")
+
 import aiohttp
+import asyncio
+import bisect
+import contextvars
 import json
+import os
+import random
 import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime
+from typing import Any, AsyncIterator, Iterable, Iterator
 from urllib.parse import unquote, urlparse, parse_qs, urlencode, urlunparse
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
 
 # ============================================================================
-# UA定义
+# UA及常量定义
 # ============================================================================
 
+STATE_MARKER = b"window.__INITIAL_STATE__"
+SCRIPT_END = b"</script>"
+STREAM_CHUNK_SIZE = 64 * 1024
+# 找到</script>后剩余内容不超过该字节数时读完丢弃，使连接可回到连接池复用；超过时直接断开
+STREAM_DRAIN_LIMIT = 256 * 1024
+
 ANDROID_UA = "Mozilla/5.0 (Linux; Android 6.0; Nexus 5 Build/MRA58N) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Mobile Safari/537.36 Edg/142.0.0.0"
 
 
+# ============================================================================
+# 超时设置
+# ============================================================================
+
+STAGE_NAMES = {
+    "connect": "建立连接",
+    "redirect": "短链接重定向",
+    "first_byte": "等待响应头",
+    "body": "读取页面内容",
+    "deadline": "整体解析",
+}
+
+# aiohttp 3.10起连接超时有单独的异常类型
+_CONNECT_TIMEOUT_ERRORS = (getattr(aiohttp, "ConnectionTimeoutError", aiohttp.ServerTimeoutError),)
+
+
+class StageTimeouts:
+    """各阶段超时（秒），为None表示不限制
+
+    connect: 建立TCP/TLS连接；redirect: 短链接请求直到收到响应头；
+    first_byte: 页面请求直到收到响应头；body: 读取页面内容。
+    """
+
+    def __init__(
+        self,
+        connect: float | None = 5.0,
+        redirect: float | None = 10.0,
+        first_byte: float | None = 10.0,
+        body: float | None = 20.0,
+    ):
+        self.connect = connect
+        self.redirect = redirect
+        self.first_byte = first_byte
+        self.body = body
+
+
+# ============================================================================
+# 阶段追踪
+# ============================================================================
+
+class StageEvent:
+    """一个阶段结束时交给追踪回调的记录
+
+    stage为redirect（短链接重定向）、fetch（获取页面）、extract（定位__INITIAL_STATE__）、
+    decode（JSON解析）或parse（提取笔记字段）；start/end为time.monotonic()时间；nbytes为该阶段处理的字节数，
+    其中fetch为从连接读取的字节数（流式读取时含读完丢弃的剩余部分），返回内容的长度见attrs["body_bytes"]；
+    outcome为"ok"或异常类名，error为异常本身；attrs为阶段相关信息（url、host、status、path等）。
+    """
+
+    __slots__ = ("stage", "start", "end", "nbytes", "outcome", "error", "attrs")
+
+    def __init__(self, stage: str, start: float, end: float, nbytes: int, error: BaseException | None, attrs: dict):
+        self.stage = stage
+        self.start = start
+        self.end = end
+        self.nbytes = nbytes
+        self.outcome = "ok" if error is None else type(error).__name__
+        self.error = error
+        self.attrs = attrs
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    def __repr__(self) -> str:
+        return f"StageEvent({self.stage}, {self.duration * 1000:.2f}ms, {self.nbytes}B, {self.outcome})"
+
+
+# 当前上下文中注册的追踪回调；asyncio任务创建时复制上下文，回调随之传递到并发的解析任务
+_stage_hooks: contextvars.ContextVar[tuple] = contextvars.ContextVar("xhs_stage_hooks", default=())
+
+
+@contextmanager
+def trace_stages(hook):
+    """在with范围内为每个阶段调用hook(StageEvent)，可嵌套注册多个回调"""
+    token = _stage_hooks.set(_stage_hooks.get() + (hook,))
+    try:
+        yield hook
+    finally:
+        _stage_hooks.reset(token)
+
+
+# 创建阶段span所用的tracer，默认不创建；需调用enable_otel或set_otel_tracer开启
+_otel_tracer = None
+
+# 阶段属性到OpenTelemetry语义约定属性名的映射，其余属性加xhs.前缀
+OTEL_ATTRIBUTES = {
+    "url": "url.full",
+    "host": "server.address",
+    "status": "http.response.status_code",
+    "content_type": "http.response.header.content-type",
+}
+
+
+def set_otel_tracer(tracer):
+    """设置创建阶段span所用的tracer；传入None关闭span创建"""
+    global _otel_tracer
+    _otel_tracer = tracer
+
+
+def enable_otel(tracer_provider=None):
+    """为每个阶段创建OpenTelemetry span；tracer_provider为空时使用全局配置的provider"""
+    if otel_trace is None:
+        raise RuntimeError("未安装opentelemetry-api")
+    set_otel_tracer(otel_trace.get_tracer("xhs_parser", tracer_provider=tracer_provider))
+
+
+class _Stage:
+    """记录一个阶段的耗时和结果，退出时依次调用追踪回调，启用OpenTelemetry时同时结束对应span"""
+
+    __slots__ = ("hooks", "stage", "start", "nbytes", "attrs", "span", "_span_scope")
+
+    def __init__(self, hooks: tuple, stage: str):
+        self.hooks = hooks
+        self.stage = stage
+        self.nbytes = 0
+        self.attrs = {}
+        self.span = None
+
+    def record(self, nbytes: int = 0, **attrs):
+        self.nbytes += nbytes
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        tracer = _otel_tracer
+        if tracer is not None:
+            # 设为当前span，阶段内发起的请求等子span挂在其下
+            self.span = tracer.start_span(f"xhs.{self.stage}")
+            self._span_scope = otel_trace.use_span(
+                self.span, end_on_exit=False, record_exception=False, set_status_on_exception=False
+            )
+            self._span_scope.__enter__()
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.monotonic()
+        if self.span is not None:
+            self._end_span(exc)
+        if self.hooks:
+            event = StageEvent(self.stage, self.start, end, self.nbytes, exc, self.attrs)
+            for hook in self.hooks:
+                hook(event)
+        return False
+
+    def _end_span(self, exc: BaseException | None):
+        span = self.span
+        for key, value in self.attrs.items():
+            if value is not None:
+                span.set_attribute(OTEL_ATTRIBUTES.get(key) or f"xhs.{key}", value)
+        span.set_attribute("xhs.bytes", self.nbytes)
+        if exc is not None:
+            span.record_exception(exc)
+            span.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR, str(exc)))
+        self._span_scope.__exit__(None, None, None)
+        span.end()
+
+
+class _NoopStage:
+    """未注册回调时使用的空阶段"""
+
+    __slots__ = ()
+
+    def record(self, nbytes: int = 0, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_STAGE = _NoopStage()
+
+
+def _trace(stage: str) -> _Stage | _NoopStage:
+    """开始追踪一个阶段；没有注册回调且未启用OpenTelemetry时返回共享的空阶段，几乎没有开销"""
+    hooks = _stage_hooks.get()
+    if not hooks and _otel_tracer is None:
+        return _NOOP_STAGE
+    return _Stage(hooks, stage)
+
+
+# ============================================================================
+# 指标
+# ============================================================================
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 覆盖从亚毫秒级的JSON解析到秒级的页面抓取
+DURATION_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class Metric:
+    """带标签的指标，按标签值组合分别计数"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> Iterator[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """只增不减的计数"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """可增可减的当前值"""
+
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    """按上界分桶的分布，渲染时输出累计桶计数、总和与样本数"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DURATION_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._histograms: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._histograms.get(key)
+        if state is None:
+            # 各桶（非累计）计数，最后一格为+Inf；之后是总和与样本数
+            state = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def value(self, **labels) -> float:
+        """样本数"""
+        state = self._histograms.get(self._key(labels))
+        return state[2] if state is not None else 0
+
+    def _samples(self) -> Iterator[str]:
+        names = self.labelnames + ("le",)
+        for key, (counts, total, count) in self._histograms.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                yield f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class MetricsRegistry:
+    """进程内指标注册表，render()输出Prometheus文本格式"""
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"指标已注册: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(
+        self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DURATION_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        return "".join(metric.render() + "\n" for metric in self._metrics.values())
+
+
+class XhsMetrics:
+    """解析器的内置指标，传给XhsClient(metrics=...)后自动采集
+
+    包括按主机和状态码的请求数、进行中的请求和解析数、各缓存的命中情况、
+    读取的字节数、各阶段耗时以及__INITIAL_STATE__的定位路径（targeted/full）。
+    """
+
+    def __init__(self, registry: MetricsRegistry | None = None, prefix: str = "xhs"):
+        self.registry = registry if registry is not None else MetricsRegistry()
+        r = self.registry
+        self.requests = r.counter(f"{prefix}_http_requests_total", "按主机和状态码统计的HTTP请求数", ("host", "status"))
+        self.request_errors = r.counter(f"{prefix}_http_request_errors_total", "未得到完整响应的HTTP请求数", ("host", "error"))
+        self.requests_in_flight = r.gauge(f"{prefix}_http_requests_in_flight", "进行中的HTTP请求数", ("host",))
+        self.parses = r.counter(f"{prefix}_parses_total", "按结果统计的链接解析数", ("outcome",))
+        self.parses_in_flight = r.gauge(f"{prefix}_parses_in_flight", "进行中的链接解析数")
+        self.cache_requests = r.counter(f"{prefix}_cache_requests_total", "缓存查询结果（hit/stale/miss）", ("cache", "result"))
+        self.bytes_read = r.counter(f"{prefix}_bytes_read_total", "从连接读取的页面字节数", ("host",))
+        self.stage_duration = r.histogram(f"{prefix}_stage_duration_seconds", "各阶段耗时", ("stage",))
+        self.stages = r.counter(f"{prefix}_stages_total", "按结果统计的阶段执行次数", ("stage", "outcome"))
+        self.extract_paths = r.counter(f"{prefix}_extract_total", "__INITIAL_STATE__定位路径", ("path", "outcome"))
+
+    def observe(self, event: StageEvent):
+        """阶段追踪回调，见trace_stages"""
+        self.stage_duration.observe(event.duration, stage=event.stage)
+        self.stages.inc(stage=event.stage, outcome=event.outcome)
+        if event.stage == "extract":
+            self.extract_paths.inc(path=event.attrs.get("path", ""), outcome=event.outcome)
+        elif event.stage == "fetch" and event.nbytes:
+            self.bytes_read.inc(event.nbytes, host=event.attrs.get("host", ""))
+
+    def cache(self, cache: str, result: str):
+        self.cache_requests.inc(cache=cache, result=result)
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+# ============================================================================
+# 异常定义
+# ============================================================================
+
+def _restore_error(cls, args, state):
+    error = cls.__new__(cls)
+    error.args = args
+    error.__dict__.update(state)
+    return error
+
+
+class XhsError(Exception):
+    """解析器所有异常的基类，子类带有结构化属性，可按类型判断而无需匹配消息文本"""
+
+    def __reduce__(self):
+        # 子类构造参数与args不一致，按属性还原以支持跨进程传递
+        return _restore_error, (type(self), self.args, self.__dict__)
+
+
+class HttpStatusError(XhsError):
+    """上游返回了非预期的HTTP状态码"""
+
+    def __init__(self, message: str, status: int, url: str = ""):
+        super().__init__(message)
+        self.status = status
+        self.url = url
+
+
+class RedirectError(HttpStatusError):
+    """短链接未返回可用的重定向"""
+
+
+class StateNotFoundError(XhsError):
+    """页面中找不到完整的window.__INITIAL_STATE__对象"""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class StateDecodeError(XhsError):
+    """__INITIAL_STATE__的JSON解码失败"""
+
+    def __init__(self, message: str, pos: int, snippet: str, backend: str):
+        super().__init__(message)
+        self.pos = pos
+        self.snippet = snippet
+        self.backend = backend
+
+
+class NoteStructureError(XhsError):
+    """JSON中没有noteData.data.noteData，结构可能已变化或笔记不可见"""
+
+    def __init__(self, message: str, path: tuple[str, ...]):
+        super().__init__(message)
+        self.path = path
+
+
+class TimeoutStageError(XhsError, asyncio.TimeoutError):
+    """某个阶段超时，stage为connect/redirect/first_byte/body/deadline之一"""
+
+    def __init__(self, stage: str, timeout: float, url: str = ""):
+        message = f"{STAGE_NAMES.get(stage, stage)}超时（{timeout}秒）"
+        super().__init__(f"{message}: {url}" if url else message)
+        self.stage = stage
+        self.timeout = timeout
+        self.url = url
+
+
+class CachedFailureError(XhsError):
+    """负缓存命中：该笔记近期已失败，未发起网络请求"""
+
+    def __init__(self, note_id: str, kind: str, message: str, status: int | None = None):
+        super().__init__(f"笔记{note_id}近期解析失败（{kind}），暂不重试: {message}")
+        self.note_id = note_id
+        self.kind = kind
+        self.status = status
+
+
+class CircuitOpenError(XhsError):
+    """主机熔断中，请求未发出"""
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"{host}已熔断，{retry_after:.1f}秒后重新探测")
+        self.host = host
+        self.retry_after = retry_after
+
+
+# 页面已取得但解析失败的异常
+PARSE_ERRORS = (StateNotFoundError, StateDecodeError, NoteStructureError)
+
+
+# ============================================================================
+# JSON后端
+# ============================================================================
+
+JSON_BACKEND_ENV = "XHS_JSON_BACKEND"
+JSON_BACKEND_PREFERENCE = ("orjson", "msgspec", "ujson", "json")
+
+
+class JsonBackend:
+    """JSON编解码实现：loads接受bytes/memoryview，dumps返回UTF-8字节"""
+
+    def __init__(self, name: str, loads, dumps, errors: tuple[type[Exception], ...]):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+        self.errors = errors
+
+    def __repr__(self) -> str:
+        return f"JsonBackend({self.name!r})"
+
+
+JSON_BACKENDS: dict[str, JsonBackend] = {
+    "json": JsonBackend(
+        "json",
+        lambda buf: json.loads(bytes(buf)),
+        lambda obj: json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+        (ValueError,),
+    ),
+}
+
+if orjson is not None:
+    JSON_BACKENDS["orjson"] = JsonBackend("orjson", orjson.loads, orjson.dumps, (orjson.JSONDecodeError,))
+
+if msgspec is not None:
+    JSON_BACKENDS["msgspec"] = JsonBackend(
+        "msgspec", msgspec.json.decode, msgspec.json.encode, (msgspec.DecodeError,)
+    )
+
+if ujson is not None:
+    JSON_BACKENDS["ujson"] = JsonBackend(
+        "ujson",
+        lambda buf: ujson.loads(bytes(buf)),
+        lambda obj: ujson.dumps(obj, ensure_ascii=False).encode("utf-8"),
+        (ValueError,),
+    )
+
+
+def get_json_backend(name: str | JsonBackend | None = None) -> JsonBackend:
+    """获取JSON后端
+
+    name为空时读取环境变量XHS_JSON_BACKEND，仍为空则按orjson、msgspec、ujson、json的顺序
+    选择第一个已安装的实现。指定了未安装的后端时抛出ValueError。
+    """
+    if isinstance(name, JsonBackend):
+        return name
+    if not name:
+        name = os.environ.get(JSON_BACKEND_ENV, "")
+    if name:
+        backend = JSON_BACKENDS.get(name.lower())
+        if backend is None:
+            raise ValueError(f"JSON后端不可用: {name}，可选: {', '.join(JSON_BACKENDS)}")
+        return backend
+    for candidate in JSON_BACKEND_PREFERENCE:
+        if candidate in JSON_BACKENDS:
+            return JSON_BACKENDS[candidate]
+    return JSON_BACKENDS["json"]
+
+
+# ============================================================================
+# 缓存
+# ============================================================================
+
+NOTE_ID_PATTERN = re.compile(r'/(?:explore|discovery/item)/([0-9a-zA-Z]+)')
+
+
+def extract_note_id(url: str) -> str | None:
+    """从/explore/<id>或/discovery/item/<id>路径中提取笔记ID"""
+    match = NOTE_ID_PATTERN.search(urlparse(url).path)
+    return match.group(1) if match else None
+
+
+# CDN签名直链中的过期时间参数：十进制unix时间戳，或t=十六进制时间戳
+MEDIA_EXPIRY_PARAMS = ("x-expires", "Expires", "expires", "e")
+
+
+def media_expires_at(result: dict) -> float | None:
+    """从结果中的签名媒体直链解析最早的过期时间（unix时间戳），没有时返回None"""
+    urls = [result.get("video_url", "")] + list(result.get("image_urls", []))
+    earliest = None
+    for url in urls:
+        if not url or "?" not in url:
+            continue
+        params = parse_qs(urlparse(url).query)
+        expires = None
+        for name in MEDIA_EXPIRY_PARAMS:
+            value = params.get(name, [""])[0]
+            if value.isdigit():
+                expires = float(value)
+                break
+        if expires is None:
+            value = params.get("t", [""])[0]
+            try:
+                expires = float(int(value, 16)) if len(value) == 8 else None
+            except ValueError:
+                expires = None
+        if expires is not None and (earliest is None or expires < earliest):
+            earliest = expires
+    return earliest
+
+
+class ResultCache:
+    """笔记结果缓存的公共部分：TTL计算与命中统计
+
+    子类实现协程方法lookup/set/invalidate/clear，客户端只依赖这组接口。
+    stale_ttl大于0时启用stale-while-revalidate：条目过期后的stale_ttl秒内仍可返回，
+    由调用方在后台刷新。结果中含签名媒体直链时，会在直链过期前media_refresh_margin秒
+    转为陈旧状态，且陈旧期不会超过直链的实际过期时间。
+    """
+
+    def __init__(
+        self,
+        ttl: float = 600.0,
+        ttl_by_type: dict[str, float] | None = None,
+        stale_ttl: float = 0.0,
+        media_refresh_margin: float = 60.0,
+    ):
+        self.ttl = ttl
+        self.ttl_by_type = dict(ttl_by_type or {})
+        self.stale_ttl = stale_ttl
+        self.media_refresh_margin = media_refresh_margin
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def ttl_for(self, result: dict) -> float:
+        """结果对应的TTL（秒）"""
+        return self.ttl_by_type.get(result.get("type", ""), self.ttl)
+
+    def lifetimes(self, result: dict, ttl: float | None = None) -> tuple[float, float]:
+        """返回 (新鲜期, 最长可返回期限)，均为距现在的秒数"""
+        fresh = self.ttl_for(result) if ttl is None else ttl
+        limit = fresh + self.stale_ttl
+        expires = media_expires_at(result)
+        if expires is not None:
+            remaining = expires - time.time()
+            fresh = min(fresh, remaining - self.media_refresh_margin)
+            limit = min(limit, remaining)
+        return fresh, limit
+
+    async def get(self, note_id: str) -> dict | None:
+        """只返回未过期的结果"""
+        result, stale = await self.lookup(note_id)
+        return None if stale else result
+
+    def _count(self, result: dict | None, stale: bool) -> tuple[dict | None, bool]:
+        if result is None:
+            self.misses += 1
+        elif stale:
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        return result, stale
+
+    async def flush(self):
+        """把缓冲中的写入落盘，内存缓存无需操作"""
+
+    def stats(self) -> dict:
+        """命中统计"""
+        total = self.hits + self.stale_hits + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.stale_hits) / total if total else 0.0,
+        }
+
+
+class NoteCache(ResultCache):
+    """进程内的笔记结果缓存，按笔记ID索引，LRU淘汰并带过期时间
+
+    媒体直链会过期，可通过ttl_by_type为不同内容类型（video/normal）单独设置TTL。
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 600.0,
+        ttl_by_type: dict[str, float] | None = None,
+        stale_ttl: float = 0.0,
+        media_refresh_margin: float = 60.0,
+    ):
+        super().__init__(ttl, ttl_by_type, stale_ttl, media_refresh_margin)
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, tuple[float, float, dict]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def lookup(self, note_id: str) -> tuple[dict | None, bool]:
+        """返回 (结果, 是否陈旧)；未命中或超过陈旧期时结果为None"""
+        entry = self._entries.get(note_id)
+        if entry is not None:
+            expires_at, stale_until, result = entry
+            now = time.monotonic()
+            if stale_until > now:
+                self._entries.move_to_end(note_id)
+                return self._count(result, expires_at <= now)
+            del self._entries[note_id]
+        return self._count(None, False)
+
+    async def set(self, note_id: str, result: dict, ttl: float | None = None):
+        """写入结果；ttl为空时按内容类型决定"""
+        fresh, limit = self.lifetimes(result, ttl)
+        if limit <= 0:
+            return
+        now = time.monotonic()
+        self._entries[note_id] = (now + fresh, now + limit, result)
+        self._entries.move_to_end(note_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def invalidate(self, note_id: str) -> bool:
+        """删除指定笔记的缓存，返回是否存在"""
+        return self._entries.pop(note_id, None) is not None
+
+    async def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), **super().stats()}
+
+
+class SqliteNoteCache(ResultCache):
+    """基于SQLite文件的笔记结果缓存，供同一台机器上的多个工作进程共享
+
+    使用WAL模式，读写都在线程池中执行，不阻塞事件循环；写入先进入内存缓冲，
+    达到batch_size或经过flush_interval秒后批量提交，提交完成前查询仍从缓冲返回。
+    后台提交失败时条目留在缓冲中，异常在下一次flush或close时抛出。过期时间为墙钟时间戳。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = 600.0,
+        ttl_by_type: dict[str, float] | None = None,
+        stale_ttl: float = 0.0,
+        media_refresh_margin: float = 60.0,
+        batch_size: int = 64,
+        flush_interval: float = 0.5,
+        max_readers: int = 4,
+        json_backend: str | JsonBackend | None = None,
+    ):
+        super().__init__(ttl, ttl_by_type, stale_ttl, media_refresh_margin)
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.json_backend = get_json_backend(json_backend)
+        self._read_executor = ThreadPoolExecutor(max_readers, thread_name_prefix="xhs-sqlite-read")
+        # 单写线程，避免多个连接争抢写锁
+        self._write_executor = ThreadPoolExecutor(1, thread_name_prefix="xhs-sqlite-write")
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._pending: dict[str, tuple[float, float, bytes]] = {}
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._flush_task: asyncio.Task | None = None
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """当前线程的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _init_db(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS notes ("
+                "note_id TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL, stale_until REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS notes_stale_until ON notes (stale_until)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _read(self, note_id: str, now: float) -> tuple[bytes, float] | None:
+        return self._connect().execute(
+            "SELECT value, expires_at FROM notes WHERE note_id = ? AND stale_until > ?", (note_id, now)
+        ).fetchone()
+
+    def _write_many(self, items: list[tuple[str, bytes, float, float]]):
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO notes (note_id, value, expires_at, stale_until) VALUES (?, ?, ?, ?)",
+                items,
+            )
+
+    def _execute(self, sql: str, params: tuple = ()) -> int:
+        conn = self._connect()
+        with conn:
+            return conn.execute(sql, params).rowcount
+
+    async def _run(self, executor: ThreadPoolExecutor, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    async def lookup(self, note_id: str) -> tuple[dict | None, bool]:
+        """返回 (结果, 是否陈旧)；未命中或超过陈旧期时结果为None"""
+        now = time.time()
+        pending = self._pending.get(note_id)
+        if pending is not None and pending[1] > now:
+            row = (pending[2], pending[0])
+        else:
+            row = await self._run(self._read_executor, self._read, note_id, now)
+        if row is None:
+            return self._count(None, False)
+        value, expires_at = row
+        return self._count(self.json_backend.loads(value), expires_at <= now)
+
+    async def set(self, note_id: str, result: dict, ttl: float | None = None):
+        """写入缓冲区；ttl为空时按内容类型决定"""
+        fresh, limit = self.lifetimes(result, ttl)
+        if limit <= 0:
+            return
+        now = time.time()
+        self._pending[note_id] = (now + fresh, now + limit, self.json_backend.dumps(result))
+        if len(self._pending) >= self.batch_size:
+            await self.flush()
+        else:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        """flush_interval秒后在后台提交缓冲；已有定时器或后台提交时不重复安排"""
+        if self._flush_handle is None and self._flush_task is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.flush_interval, self._start_flush)
+
+    def _start_flush(self):
+        self._flush_handle = None
+        self._flush_task = asyncio.ensure_future(self._write_pending())
+        self._flush_task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task: asyncio.Task):
+        # 失败的任务保留到下一次flush，由其抛出异常
+        if task is not self._flush_task or (not task.cancelled() and task.exception() is not None):
+            return
+        self._flush_task = None
+        if self._pending and not task.cancelled():
+            self._schedule_flush()
+
+    async def _write_pending(self):
+        """提交当前缓冲；写入完成后才移除条目，期间被重新写入的条目保留"""
+        if not self._pending:
+            return
+        batch = dict(self._pending)
+        items = [
+            (note_id, value, expires_at, stale_until)
+            for note_id, (expires_at, stale_until, value) in batch.items()
+        ]
+        await self._run(self._write_executor, self._write_many, items)
+        for note_id, entry in batch.items():
+            if self._pending.get(note_id) is entry:
+                del self._pending[note_id]
+
+    async def flush(self):
+        """批量提交缓冲中的写入；先等待进行中的后台提交，其失败在此抛出"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        task, self._flush_task = self._flush_task, None
+        if task is not None:
+            await task
+        await self._write_pending()
+
+    async def invalidate(self, note_id: str) -> bool:
+        """删除指定笔记的缓存，返回是否存在"""
+        had_pending = self._pending.pop(note_id, None) is not None
+        deleted = await self._run(
+            self._write_executor, self._execute, "DELETE FROM notes WHERE note_id = ?", (note_id,)
+        )
+        return had_pending or deleted > 0
+
+    async def clear(self):
+        self._pending.clear()
+        await self._run(self._write_executor, self._execute, "DELETE FROM notes")
+
+    async def purge_expired(self) -> int:
+        """删除已过期的条目，返回删除数量"""
+        return await self._run(
+            self._write_executor, self._execute, "DELETE FROM notes WHERE stale_until <= ?", (time.time(),)
+        )
+
+    async def close(self):
+        """提交缓冲并关闭所有连接；提交失败时仍关闭连接，异常继续抛出"""
+        try:
+            await self.flush()
+        finally:
+            self._read_executor.shutdown(wait=True)
+            self._write_executor.shutdown(wait=True)
+            with self._connections_lock:
+                for conn in self._connections:
+                    conn.close()
+                self._connections.clear()
+
+
+class RedirectCache:
+    """短链接重定向缓存：短码 -> 清理后的完整URL
+
+    同一短码总是指向同一篇笔记，命中时可跳过重定向请求。设置path后可用save()持久化，
+    下次创建时自动加载；过期时间使用墙钟时间以便跨进程重启保留。
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 7 * 24 * 3600, path: str | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def short_code(short_url: str) -> str:
+        """短链接的短码（路径部分，如o/67cBgM4yF9z）"""
+        if "://" not in short_url:
+            short_url = "http://" + short_url
+        return urlparse(short_url).path.strip("/")
+
+    def get(self, short_url: str) -> str | None:
+        code = self.short_code(short_url)
+        entry = self._entries.get(code)
+        if entry is not None:
+            expires_at, full_url = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(code)
+                self.hits += 1
+                return full_url
+            del self._entries[code]
+        self.misses += 1
+        return None
+
+    def set(self, short_url: str, full_url: str):
+        code = self.short_code(short_url)
+        if not code or self.ttl <= 0:
+            return
+        self._entries[code] = (time.time() + self.ttl, full_url)
+        self._entries.move_to_end(code)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, short_url: str) -> bool:
+        return self._entries.pop(self.short_code(short_url), None) is not None
+
+    def clear(self):
+        self._entries.clear()
+
+    def load(self):
+        """从path加载未过期的条目"""
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        now = time.time()
+        for code, (expires_at, full_url) in data.items():
+            if expires_at > now:
+                self._entries[code] = (expires_at, full_url)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def save(self):
+        """把未过期的条目写入path（先写临时文件再替换）"""
+        if not self.path:
+            return
+        now = time.time()
+        data = {code: entry for code, entry in self._entries.items() if entry[0] > now}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+FAILURE_NOT_FOUND = "not_found"
+FAILURE_BLOCKED = "blocked"
+FAILURE_PARSE_ERROR = "parse_error"
+
+NOT_FOUND_STATUSES = frozenset({404, 410})
+BLOCKED_STATUSES = frozenset({401, 403, 429, 451, 461, 471})
+
+
+def classify_failure(exc: Exception) -> str | None:
+    """把异常归类为not_found/blocked/parse_error；不应负缓存的异常返回None"""
+    if isinstance(exc, HttpStatusError):
+        if exc.status in NOT_FOUND_STATUSES:
+            return FAILURE_NOT_FOUND
+        if exc.status in BLOCKED_STATUSES:
+            return FAILURE_BLOCKED
+    elif isinstance(exc, PARSE_ERRORS):
+        return FAILURE_PARSE_ERROR
+    return None
+
+
+class NegativeCache:
+    """失败结果缓存：记录已删除/私密笔记及解析失败，过期前直接抛出CachedFailureError
+
+    各失败类型的TTL可通过ttl_by_kind单独设置，通常远短于结果缓存。
+    """
+
+    DEFAULT_TTL_BY_KIND = {
+        FAILURE_NOT_FOUND: 600.0,
+        FAILURE_BLOCKED: 30.0,
+        FAILURE_PARSE_ERROR: 120.0,
+    }
+
+    def __init__(self, maxsize: int = 10000, ttl_by_kind: dict[str, float] | None = None):
+        self.maxsize = maxsize
+        self.ttl_by_kind = {**self.DEFAULT_TTL_BY_KIND, **(ttl_by_kind or {})}
+        self.hits = 0
+        self._entries: OrderedDict[str, tuple[float, str, str, int | None]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def check(self, note_id: str):
+        """命中未过期的失败记录时抛出CachedFailureError"""
+        entry = self._entries.get(note_id)
+        if entry is None:
+            return
+        expires_at, kind, message, status = entry
+        if expires_at <= time.monotonic():
+            del self._entries[note_id]
+            return
+        self.hits += 1
+        raise CachedFailureError(note_id, kind, message, status)
+
+    def record(self, note_id: str, kind: str, exc: Exception):
+        """记录一次失败"""
+        ttl = self.ttl_by_kind.get(kind, 0)
+        if ttl <= 0:
+            return
+        status = getattr(exc, "status", None)
+        self._entries[note_id] = (time.monotonic() + ttl, kind, str(exc), status)
+        self._entries.move_to_end(note_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, note_id: str) -> bool:
+        return self._entries.pop(note_id, None) is not None
+
+    def clear(self):
+        self._entries.clear()
+
+
+class StateStore:
+    """按笔记ID保存压缩后的__INITIAL_STATE__片段，便于修改解析逻辑后离线重新解析
+
+    只保存从标记到</script>的片段而非整页HTML；安装了zstandard时使用zstd，否则使用zlib。
+    文件名为<笔记ID>.zst或<笔记ID>.z，读取时按扩展名选择解压方式。
+    """
+
+    def __init__(self, directory: str, level: int | None = None):
+        self.directory = directory
+        self.codec = "zst" if zstandard is not None else "z"
+        self.level = level if level is not None else (3 if self.codec == "zst" else 6)
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, note_id: str, codec: str | None = None) -> str:
+        return os.path.join(self.directory, f"{note_id}.{codec or self.codec}")
+
+    def note_ids(self) -> list[str]:
+        """已保存的笔记ID"""
+        ids = []
+        for name in os.listdir(self.directory):
+            note_id, _, ext = name.rpartition(".")
+            if ext in ("zst", "z") and note_id:
+                ids.append(note_id)
+        return ids
+
+    def compress(self, data: bytes) -> bytes:
+        if self.codec == "zst":
+            return zstandard.ZstdCompressor(level=self.level).compress(data)
+        return zlib.compress(data, self.level)
+
+    @staticmethod
+    def decompress(data: bytes, codec: str) -> bytes:
+        if codec == "zst":
+            if zstandard is None:
+                raise RuntimeError("读取.zst文件需要安装zstandard")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def save_sync(self, note_id: str, html: bytes | bytearray):
+        """压缩并写入页面中的state片段（先写临时文件再替换）"""
+        path = self._path(note_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.compress(_state_snippet(html)))
+        os.replace(tmp_path, path)
+
+    async def save(self, note_id: str, html: bytes | bytearray):
+        """在线程池中压缩写入，不阻塞事件循环"""
+        await asyncio.get_running_loop().run_in_executor(None, self.save_sync, note_id, html)
+
+    def load(self, note_id: str) -> bytes | None:
+        """读取并解压state片段，不存在时返回None"""
+        for codec in (self.codec, "z" if self.codec == "zst" else "zst"):
+            path = self._path(note_id, codec)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    return self.decompress(f.read(), codec)
+        return None
+
+
+def _state_snippet(html: bytes | bytearray) -> bytes:
+    """截取从__INITIAL_STATE__标记到其</script>结束的片段，找不到标记时返回原内容"""
+    start_idx = html.find(STATE_MARKER)
+    if start_idx == -1:
+        return bytes(html)
+    end_idx = html.find(SCRIPT_END, start_idx)
+    end_idx = len(html) if end_idx == -1 else end_idx + len(SCRIPT_END)
+    return bytes(html[start_idx:end_idx])
+
+
+# ============================================================================
+# 请求合并
+# ============================================================================
+
+class SingleFlight:
+    """合并同一键上的并发调用：同时只执行一次，所有等待者共享结果或异常
+
+    实际执行放在独立任务中，某个等待者被取消不会影响其他等待者。
+    """
+
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: str, func):
+        """以key合并执行func()（返回协程的可调用对象）"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task)
+
+    async def cancel_all(self):
+        """取消所有进行中的执行并等待其结束"""
+        tasks = list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _forget(self, key: str, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 所有等待者都已取消时避免"exception was never retrieved"警告
+        if not task.cancelled():
+            task.exception()
+
+
+# ============================================================================
+# 限流
+# ============================================================================
+
+# 表示被限流的状态码；5xx同样视为上游过载，收到后按乘法减小速率
+THROTTLE_STATUSES = frozenset({429, 461, 471})
+
+
+def is_throttle_status(status: int) -> bool:
+    return status in THROTTLE_STATUSES or status >= 500
+
+
+class HostLimiter:
+    """单个主机的令牌桶限速与并发上限
+
+    速率按AIMD自适应：每次成功响应加性增加（满速时约每秒增加increase），收到限流类响应时
+    乘以decrease，同一冷却期内只减一次，避免一波限流响应把速率压到底。
+    """
+
+    def __init__(
+        self,
+        rate: float = 20.0,
+        burst: float | None = None,
+        max_concurrency: int = 16,
+        min_rate: float = 0.5,
+        max_rate: float | None = None,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        cooldown: float = 1.0,
+    ):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.max_concurrency = max_concurrency
+        self.min_rate = min_rate
+        self.max_rate = max_rate if max_rate is not None else rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._last_decrease = float("-inf")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """等待并发名额和令牌"""
+        await self._semaphore.acquire()
+        try:
+            # 排队取令牌，保证先到先得
+            async with self._lock:
+                while True:
+                    self._refill(time.monotonic())
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        break
+                    await asyncio.sleep((1 - self._tokens) / self.rate)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def feedback(self, status: int):
+        """根据响应状态调整速率"""
+        now = time.monotonic()
+        if is_throttle_status(status):
+            if now - self._last_decrease >= self.cooldown:
+                self._refill(now)
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self._last_decrease = now
+        elif self.rate < self.max_rate:
+            self._refill(now)
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    async def __aenter__(self) -> "HostLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class PerHostRegistry:
+    """为每个主机按需创建一个factory实例：关键字参数作为各主机的默认配置，per_host覆盖单个主机的配置"""
+
+    factory: type
+
+    def __init__(self, per_host: dict[str, dict] | None = None, **defaults):
+        self.defaults = defaults
+        self.per_host = dict(per_host or {})
+        self._hosts: dict[str, object] = {}
+
+    def host(self, host: str):
+        item = self._hosts.get(host)
+        if item is None:
+            item = self.factory(**{**self.defaults, **self.per_host.get(host, {})})
+            self._hosts[host] = item
+        return item
+
+
+class RateLimiter(PerHostRegistry):
+    """按主机分别限速
+
+    用法::
+
+        RateLimiter(rate=20, max_concurrency=16, per_host={"xhslink.com": {"rate": 50}})
+    """
+
+    factory = HostLimiter
+
+    def stats(self) -> dict:
+        return {
+            host: {"rate": limiter.rate, "in_flight": limiter.in_flight}
+            for host, limiter in self._hosts.items()
+        }
+
+
+# ============================================================================
+# 熔断
+# ============================================================================
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+# 计入熔断失败率的异常；限流类状态码和5xx同样计为失败
+BREAKER_FAILURES = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)
+
+
+class CircuitBreaker:
+    """单个主机的熔断器（closed/open/half_open）
+
+    closed: 统计最近window秒内的请求，样本数达到min_requests且失败率达到failure_rate时打开；
+    open: 直接抛出CircuitOpenError，open_duration秒后进入half_open；
+    half_open: 最多放行half_open_max个探测请求，连续success_threshold次成功则关闭，任一失败重新打开。
+
+    每次状态切换都会递增代数；before_request返回当时的代数，after_request忽略旧代数的结果，
+    因此进入half_open之前放行的请求不会被当作探测请求。
+    """
+
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        min_requests: int = 20,
+        window: float = 30.0,
+        open_duration: float = 30.0,
+        half_open_max: int = 1,
+        success_threshold: int = 2,
+    ):
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.open_duration = open_duration
+        self.half_open_max = half_open_max
+        self.success_threshold = success_threshold
+        self.state = CIRCUIT_CLOSED
+        self._generation = 0
+        self._outcomes: deque[tuple[float, bool]] = deque()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+
+    def _set_state(self, state: str):
+        self.state = state
+        self._generation += 1
+        self._outcomes.clear()
+        self._failures = 0
+        self._probes = 0
+        self._probe_successes = 0
+
+    def _trim(self, now: float):
+        while self._outcomes and self._outcomes[0][0] <= now - self.window:
+            _, ok = self._outcomes.popleft()
+            if not ok:
+                self._failures -= 1
+
+    def _open(self, now: float):
+        self._set_state(CIRCUIT_OPEN)
+        self._opened_at = now
+
+    def before_request(self, host: str = "") -> int:
+        """请求前调用，返回需传给after_request的代数；熔断中时抛出CircuitOpenError"""
+        if self.state == CIRCUIT_CLOSED:
+            return self._generation
+        if self.state == CIRCUIT_OPEN:
+            retry_after = self._opened_at + self.open_duration - time.monotonic()
+            if retry_after > 0:
+                raise CircuitOpenError(host, retry_after)
+            self._set_state(CIRCUIT_HALF_OPEN)
+        if self._probes >= self.half_open_max:
+            raise CircuitOpenError(host, 0.0)
+        self._probes += 1
+        return self._generation
+
+    def after_request(self, generation: int, ok: bool | None):
+        """请求结束后调用；ok为None表示请求被取消，不计入统计；状态已切换过的旧请求被忽略"""
+        if generation != self._generation:
+            return
+        now = time.monotonic()
+        if self.state == CIRCUIT_HALF_OPEN:
+            self._probes -= 1
+            if ok is None:
+                return
+            if not ok:
+                self._open(now)
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.success_threshold:
+                self._set_state(CIRCUIT_CLOSED)
+            return
+        if ok is None:
+            return
+        self._outcomes.append((now, ok))
+        if not ok:
+            self._failures += 1
+        self._trim(now)
+        total = len(self._outcomes)
+        if total >= self.min_requests and self._failures / total >= self.failure_rate:
+            self._open(now)
+
+
+class CircuitBreakers(PerHostRegistry):
+    """按主机分别熔断，配置方式同RateLimiter"""
+
+    factory = CircuitBreaker
+
+    def stats(self) -> dict:
+        return {host: breaker.state for host, breaker in self._hosts.items()}
+
+
+# ============================================================================
+# 重试
+# ============================================================================
+
+RETRY_STATUSES = frozenset({429, 461, 471, 500, 502, 503, 504})
+RETRY_EXCEPTIONS = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)
+
+# 本次解析的截止时间（事件循环时间），由parse_xhs_link设置，重试时不会等待超过它
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("xhs_deadline", default=None)
+
+
+class RetryPolicy:
+    """重试策略：指数退避+全抖动（每次等待在[0, min(max_delay, base_delay*2^n)]内随机）
+
+    可重试的情况为retry_statuses中的状态码、连接断开/重置以及超时。
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.2,
+        max_delay: float = 5.0,
+        retry_statuses: Iterable[int] = RETRY_STATUSES,
+        retry_exceptions: tuple[type[BaseException], ...] = RETRY_EXCEPTIONS,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_exceptions = retry_exceptions
+
+    def is_retryable(self, exc: Exception) -> bool:
+        if isinstance(exc, HttpStatusError):
+            return exc.status in self.retry_statuses
+        return isinstance(exc, self.retry_exceptions)
+
+    def backoff(self, attempt: int) -> float:
+        """第attempt次重试（从0开始）前的等待秒数"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+# XhsClient未指定retry时的占位值，每个客户端各自创建默认RetryPolicy；retry=None表示不重试
+_DEFAULT_RETRY: Any = object()
+
+
+async def _with_retry(policy: RetryPolicy | None, func):
+    """按策略重试func()；剩余时间不足以等待下一次退避时直接抛出最后一次的异常"""
+    attempt = 0
+    while True:
+        try:
+            return await func()
+        except Exception as e:
+            attempt += 1
+            if policy is None or attempt >= policy.max_attempts or not policy.is_retryable(e):
+                raise
+            delay = policy.backoff(attempt - 1)
+            deadline = _deadline.get()
+            if deadline is not None and asyncio.get_running_loop().time() + delay >= deadline:
+                raise
+            await asyncio.sleep(delay)
+
+
+# ============================================================================
+# 对冲请求
+# ============================================================================
+
+class HedgePolicy:
+    """页面抓取的对冲策略
+
+    首个请求在delay()秒内未收到响应头时，再发起一个请求，取先完成者并取消另一个。
+    delay取近期响应头耗时的percentile分位数；对冲次数受预算限制：每个首发请求积累
+    max_extra_load个令牌，每次对冲消耗一个，因此额外负载不超过max_extra_load比例。
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        max_extra_load: float = 0.05,
+        min_delay: float = 0.05,
+        max_delay: float = 2.0,
+        initial_delay: float = 0.5,
+        window: int = 512,
+        min_samples: int = 20,
+        max_budget: float = 10.0,
+    ):
+        self.percentile = percentile
+        self.max_extra_load = max_extra_load
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.max_budget = max_budget
+        self.primaries = 0
+        self.hedges = 0
+        self._samples: deque[float] = deque(maxlen=window)
+        self._budget = 0.0
+
+    def record(self, seconds: float):
+        """记录一次响应头耗时"""
+        self._samples.append(seconds)
+
+    def delay(self) -> float:
+        """当前的对冲等待时间"""
+        if len(self._samples) < self.min_samples:
+            return self.initial_delay
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile))
+        return min(self.max_delay, max(self.min_delay, ordered[index]))
+
+    def on_primary(self):
+        self.primaries += 1
+        self._budget = min(self.max_budget, self._budget + self.max_extra_load)
+
+    def try_hedge(self) -> bool:
+        """预算足够时消耗一次对冲额度"""
+        if self._budget < 1:
+            return False
+        self._budget -= 1
+        self.hedges += 1
+        return True
+
+
+async def _hedged(policy: HedgePolicy, attempt):
+    """执行attempt(headers_event)，必要时发起对冲请求，返回先成功的结果
+
+    返回或抛出（含调用方被取消）时，尚未完成的请求都会被取消并等待其结束。
+    """
+    policy.on_primary()
+    headers_received = asyncio.Event()
+    primary = asyncio.ensure_future(attempt(headers_received))
+    tasks = [primary]
+    try:
+        waiter = asyncio.ensure_future(headers_received.wait())
+        try:
+            await asyncio.wait({primary, waiter}, timeout=policy.delay(), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+        if headers_received.is_set() or primary.done() or not policy.try_hedge():
+            return await primary
+
+        tasks.append(asyncio.ensure_future(attempt(None)))
+        pending = set(tasks)
+        first_error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                if first_error is None:
+                    first_error = task.exception()
+        raise first_error
+    finally:
+        unfinished = [task for task in tasks if not task.done()]
+        for task in unfinished:
+            task.cancel()
+        if unfinished:
+            await asyncio.gather(*unfinished, return_exceptions=True)
+
+
+# ============================================================================
+# 客户端
+# ============================================================================
+
+class XhsClient:
+    """持有长连接会话的客户端，在多次解析之间复用TCP/TLS连接
+
+    用法::
+
+        async with XhsClient() as client:
+            note = await parse_xhs_link(url, client)
+
+    base_urls按主机名覆盖实际请求的地址（如{"xhslink.com": "http://127.0.0.1:8080"}），
+    用于对本地模拟服务做压测；缓存、限流、熔断和指标仍按原主机名记录。
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 20,
+        keepalive_timeout: float = 30.0,
+        ttl_dns_cache: int = 300,
+        stream: bool = True,
+        targeted: bool = True,
+        json_backend: str | JsonBackend | None = None,
+        result_cache: ResultCache | None = None,
+        redirect_cache: RedirectCache | None = None,
+        state_store: StateStore | None = None,
+        negative_cache: NegativeCache | None = None,
+        rate_limiter: RateLimiter | None = None,
+        circuit_breaker: CircuitBreakers | None = None,
+        metrics: XhsMetrics | None = None,
+        retry: RetryPolicy | None = _DEFAULT_RETRY,
+        deadline: float | None = None,
+        hedge: HedgePolicy | None = None,
+        timeouts: StageTimeouts | None = None,
+        base_urls: dict[str, str] | None = None,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.ttl_dns_cache = ttl_dns_cache
+        self.stream = stream
+        self.targeted = targeted
+        self.json_backend = get_json_backend(json_backend)
+        self.result_cache = result_cache
+        self.redirect_cache = redirect_cache
+        self.state_store = state_store
+        self.negative_cache = negative_cache
+        self.rate_limiter = rate_limiter
+        self.circuit_breaker = circuit_breaker
+        self.metrics = metrics
+        self.retry = RetryPolicy() if retry is _DEFAULT_RETRY else retry
+        self.deadline = deadline
+        self.hedge = hedge
+        self.timeouts = timeouts if timeouts is not None else StageTimeouts()
+        self.base_urls = {host: urlparse(base) for host, base in (base_urls or {}).items()}
+        self._redirect_flight = SingleFlight()
+        self._page_flight = SingleFlight()
+        self._refresh_tasks: dict[str, asyncio.Task] = {}
+        self._session: aiohttp.ClientSession | None = None
+        self._closed = False
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """共享会话，首次访问时在当前事件循环中创建；客户端关闭后不再重新创建"""
+        if self._closed:
+            raise RuntimeError("XhsClient已关闭")
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.ttl_dns_cache,
+                use_dns_cache=True,
+            )
+            # 整体超时由各阶段的asyncio.timeout控制，会话只设置连接超时
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeouts.connect)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    def request_url(self, url: str) -> str:
+        """按base_urls替换URL的协议、主机和路径前缀，未配置覆盖的主机原样返回"""
+        if not self.base_urls:
+            return url
+        parsed = urlparse(url)
+        base = self.base_urls.get(parsed.hostname or "")
+        if base is None:
+            return url
+        return urlunparse(parsed._replace(scheme=base.scheme, netloc=base.netloc, path=base.path.rstrip("/") + parsed.path))
+
+    @property
+    def closed(self) -> bool:
+        return self._closed or self._session is None or self._session.closed
+
+    async def close(self):
+        """关闭会话及连接池，提交结果缓存的缓冲写入并持久化短链接缓存
+
+        进行中的后台刷新及合并执行的请求会先被取消，不会在关闭后继续写入缓存。
+        """
+        self._closed = True
+        refresh_tasks = list(self._refresh_tasks.values())
+        for task in refresh_tasks:
+            task.cancel()
+        if refresh_tasks:
+            await asyncio.gather(*refresh_tasks, return_exceptions=True)
+        await self._page_flight.cancel_all()
+        await self._redirect_flight.cancel_all()
+        if self.result_cache is not None:
+            await self.result_cache.flush()
+        if self.redirect_cache is not None:
+            self.redirect_cache.save()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _schedule_refresh(self, note_id: str, func):
+        """为陈旧的缓存条目安排后台刷新，每个笔记同时最多一个刷新任务"""
+        if note_id in self._refresh_tasks:
+            return
+        # 后台刷新不受触发它的那次调用的截止时间约束
+        context = contextvars.copy_context()
+        context.run(_deadline.set, None)
+        task = asyncio.get_running_loop().create_task(self._page_flight.do(note_id, func), context=context)
+        self._refresh_tasks[note_id] = task
+
+        def done(t: asyncio.Task):
+            self._refresh_tasks.pop(note_id, None)
+            if not t.cancelled():
+                t.exception()
+
+        task.add_done_callback(done)
+
+    async def __aenter__(self) -> "XhsClient":
+        self.session
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+@asynccontextmanager
+async def _client_scope(client: XhsClient | None):
+    """使用调用方传入的客户端；未传入时创建一次性客户端并在结束后关闭"""
+    if client is not None:
+        yield client
+        return
+    async with XhsClient() as temp_client:
+        yield temp_client
+
+
+async def _get(client: XhsClient, url: str, stage: str, timeout: float | None, **kwargs) -> aiohttp.ClientResponse:
+    """在阶段超时内发出请求并等到响应头；实际请求按base_urls改写地址，错误中仍报告原URL"""
+    try:
+        async with asyncio.timeout(timeout) as cm:
+            return await client.session.get(client.request_url(url), **kwargs)
+    except _CONNECT_TIMEOUT_ERRORS as e:
+        raise TimeoutStageError("connect", client.timeouts.connect, url) from e
+    except asyncio.TimeoutError as e:
+        if cm.expired():
+            raise TimeoutStageError(stage, timeout, url) from e
+        raise
+
+
+@asynccontextmanager
+async def _request(client: XhsClient, url: str, stage: str, timeout: float | None, **kwargs):
+    """发起GET请求
+
+    依次经过主机熔断和限流，超时按stage归类；响应状态反馈给限流器，
+    请求结果（含调用方读取响应体时的失败）计入熔断统计和请求指标。
+    """
+    host = urlparse(url).hostname or ""
+    breaker = client.circuit_breaker.host(host) if client.circuit_breaker else None
+    limiter = client.rate_limiter.host(host) if client.rate_limiter else None
+    metrics = client.metrics
+
+    if breaker is not None:
+        generation = breaker.before_request(host)
+    ok = None
+    try:
+        if limiter is not None:
+            await limiter.acquire()
+        if metrics is not None:
+            metrics.requests_in_flight.inc(host=host)
+        try:
+            async with await _get(client, url, stage, timeout, **kwargs) as response:
+                if limiter is not None:
+                    limiter.feedback(response.status)
+                if metrics is not None:
+                    metrics.requests.inc(host=host, status=response.status)
+                ok = not is_throttle_status(response.status)
+                yield response
+        finally:
+            if metrics is not None:
+                metrics.requests_in_flight.dec(host=host)
+            if limiter is not None:
+                limiter.release()
+    except BREAKER_FAILURES as e:
+        ok = False
+        if metrics is not None:
+            metrics.request_errors.inc(host=host, error=type(e).__name__)
+        raise
+    finally:
+        if breaker is not None:
+            breaker.after_request(generation, ok)
+
+
+async def _read_with_timeout(client: XhsClient, url: str, read):
+    """在body阶段超时内执行read()"""
+    timeout = client.timeouts.body
+    try:
+        async with asyncio.timeout(timeout) as cm:
+            return await read()
+    except asyncio.TimeoutError as e:
+        if cm.expired():
+            raise TimeoutStageError("body", timeout, url) from e
+        raise
+
+
 # ============================================================================
 # 工具函数
 # ============================================================================
@@ -48,108 +1853,374 @@ async def get_headers():
     }
 
 
-async def get_redirect_url(short_url: str) -> str:
+async def get_redirect_url(short_url: str, client: "XhsClient | None" = None) -> str:
     """获取短链接重定向后的完整URL"""
     headers = await get_headers()
-    async with aiohttp.ClientSession() as session:
-        async with session.get(short_url, headers=headers, allow_redirects=False) as response:
-            if response.status == 302:
-                redirect_url = response.headers.get("Location", "")
-                return unquote(redirect_url)
-            else:
-                raise Exception(f"无法获取重定向URL，状态码: {response.status}")
+    async with _client_scope(client) as c:
+        async def attempt() -> str:
+            async with _request(
+                c, short_url, "redirect", c.timeouts.redirect, headers=headers, allow_redirects=False
+            ) as response:
+                span.record(status=response.status)
+                if response.status == 302:
+                    redirect_url = response.headers.get("Location", "")
+                    if not redirect_url:
+                        raise RedirectError("重定向响应缺少Location", response.status, short_url)
+                    return unquote(redirect_url)
+                else:
+                    raise RedirectError(f"无法获取重定向URL，状态码: {response.status}", response.status, short_url)
+
+        with _trace("redirect") as span:
+            span.record(url=short_url, host=urlparse(short_url).hostname or "")
+            return await _with_retry(c.retry, attempt)
+
+
+async def resolve_short_link(short_url: str, client: "XhsClient | None" = None) -> str:
+    """解析短链接为清理后的完整URL，优先使用客户端的短链接缓存"""
+    cache = client.redirect_cache if client is not None else None
+    metrics = client.metrics if client is not None else None
+    if cache is not None:
+        full_url = cache.get(short_url)
+        if metrics is not None:
+            metrics.cache("redirect", "miss" if full_url is None else "hit")
+        if full_url is not None:
+            return full_url
+
+    async def resolve() -> str:
+        full_url = clean_share_url(await get_redirect_url(short_url, client))
+        if cache is not None:
+            cache.set(short_url, full_url)
+        return full_url
+
+    if client is None:
+        return await resolve()
+    return await client._redirect_flight.do(RedirectCache.short_code(short_url), resolve)
+
+
+async def fetch_page(url: str, client: "XhsClient | None" = None, stream: bool = False) -> str:
+    """获取页面HTML内容
 
+    stream为True时边读边查找__INITIAL_STATE__脚本，读到其</script>即停止，
+    只返回从标记开始到</script>结束的片段；剩余内容较少时读完丢弃以复用连接，否则断开。
+    """
+    body, charset = await _fetch_body(url, client, stream)
+    return body.decode(charset, errors="replace")
 
-async def fetch_page(url: str) -> str:
-    """获取页面HTML内容"""
+
+async def _fetch_body(url: str, client: "XhsClient | None", stream: bool) -> tuple[bytes, str]:
+    """获取页面原始字节及其编码"""
     headers = await get_headers()
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as response:
-            if response.status == 200:
-                return await response.text()
+    async with _client_scope(client) as c:
+        async def attempt(headers_received: asyncio.Event | None = None) -> tuple[bytes, str]:
+            started = time.monotonic()
+            async with _request(c, url, "first_byte", c.timeouts.first_byte, headers=headers) as response:
+                if c.hedge is not None:
+                    c.hedge.record(time.monotonic() - started)
+                if headers_received is not None:
+                    headers_received.set()
+                span.record(status=response.status, content_type=response.content_type)
+                if response.status == 200:
+                    charset = response.charset or "utf-8"
+                    if not stream:
+                        body = await _read_with_timeout(c, url, response.read)
+                        span.record(len(body))
+                    else:
+                        body, nread = await _read_with_timeout(c, url, lambda: _read_state_bytes(response))
+                        span.record(nread)
+                    return body, charset
+                else:
+                    raise HttpStatusError(f"无法获取页面内容，状态码: {response.status}", response.status, url)
+
+        with _trace("fetch") as span:
+            span.record(url=url, host=urlparse(url).hostname or "", note_id=extract_note_id(url))
+            if c.hedge is None:
+                body, charset = await _with_retry(c.retry, attempt)
             else:
-                raise Exception(f"无法获取页面内容，状态码: {response.status}")
+                body, charset = await _with_retry(c.retry, lambda: _hedged(c.hedge, attempt))
+            span.record(body_bytes=len(body))
+            return body, charset
+
+
+async def _read_state_bytes(response: aiohttp.ClientResponse) -> tuple[bytes, int]:
+    """分块读取响应体，找到__INITIAL_STATE__所在脚本的结尾后停止
+
+    返回 (内容, 从连接读取的总字节数)。找到时内容为从标记到</script>（含）的字节；
+    页面中没有标记时为完整响应体。找到标记后丢弃其前面的内容；之后剩余的响应体见_finish_stream。
+    """
+    buf = bytearray()
+    found = False
+    search_from = 0
+    consumed = 0
+    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+        buf += chunk
+        consumed += len(chunk)
+        if not found:
+            marker_idx = buf.find(STATE_MARKER, search_from)
+            if marker_idx == -1:
+                # 保留可能跨块的标记前缀
+                search_from = max(0, len(buf) - len(STATE_MARKER) + 1)
+                continue
+            del buf[:marker_idx]
+            found = True
+            search_from = len(STATE_MARKER)
+        end_idx = buf.find(SCRIPT_END, search_from)
+        if end_idx != -1:
+            consumed += await _finish_stream(response, consumed)
+            return bytes(buf[:end_idx + len(SCRIPT_END)]), consumed
+        search_from = max(search_from, len(buf) - len(SCRIPT_END) + 1)
+    return bytes(buf), consumed
+
+
+async def _finish_stream(response: aiohttp.ClientResponse, consumed: int) -> int:
+    """处理未读完的响应体：剩余不超过STREAM_DRAIN_LIMIT时读完丢弃以释放连接，否则断开连接
+
+    返回读完丢弃的字节数。
+    """
+    if response.content_length is not None and response.content_length - consumed > STREAM_DRAIN_LIMIT:
+        response.close()
+        return 0
+    drained = 0
+    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+        drained += len(chunk)
+        if drained > STREAM_DRAIN_LIMIT:
+            response.close()
+            break
+    return drained
 
 
 # ============================================================================
 # 数据提取函数
 # ============================================================================
 
-def extract_initial_state(html: str) -> dict:
-    """从HTML中提取window.__INITIAL_STATE__的JSON数据"""
-    pattern = r'window\.__INITIAL_STATE__\s*=\s*(\{.*?\})\s*</script>'
-    match = re.search(pattern, html, re.DOTALL)
+# 括号扫描用的正则片段：字符串字面量（双引号/单引号，含转义）与普通字符整段跳过，
+# 不含嵌套的叶子对象也整体跳过，Python层只需处理少量非叶子括号和字符串外的undefined
+_STRING_PATTERN = rb'"[^"\\]*+(?:\\.[^"\\]*+)*+"' rb"|'[^'\\]*+(?:\\.[^'\\]*+)*+'"
+_PLAIN_PATTERN = (
+    rb"""[^"'{}u]++"""
+    rb"|(?<=[\w$])u|u(?!ndefined(?![\w$]))|"
+    + _STRING_PATTERN
+)
+_LEAF_OBJECT_PATTERN = rb"\{(?:" + _PLAIN_PATTERN + rb")*+\}"
+_NEXT_TOKEN_RE = re.compile(
+    rb"(?:" + _PLAIN_PATTERN + rb"|" + _LEAF_OBJECT_PATTERN + rb")*+(?:[{}]|undefined)",
+    re.DOTALL,
+)
+_OPEN_BRACE = ord("{")
+_CLOSE_BRACE = ord("}")
+_UNDEFINED = b"undefined"
+_NULL = b"null"
 
-    if match:
-        json_str = match.group(1)
-        json_str = re.sub(r'\bundefined\b', 'null', json_str)
-        try:
-            return json.loads(json_str)
-        except json.JSONDecodeError:
-            pass
 
-    start_marker = 'window.__INITIAL_STATE__'
-    start_idx = html.find(start_marker)
-    if start_idx == -1:
-        raise Exception("无法找到window.__INITIAL_STATE__数据")
+def _match_object(buf: bytes | bytearray, start: int, end: int) -> tuple[int, list[int]]:
+    """从start处的'{'开始匹配括号
 
-    json_start = html.find('{', start_idx)
-    if json_start == -1:
-        raise Exception("无法找到JSON开始位置")
+    返回 (对象结束位置（不含）, 字符串外undefined的起始位置列表)，未闭合时结束位置为-1。
+    """
+    match_next = _NEXT_TOKEN_RE.match
+    undefined_positions = []
+    depth = 1
+    pos = start + 1
+    while True:
+        m = match_next(buf, pos, end)
+        if m is None:
+            return -1, undefined_positions
+        pos = m.end()
+        last = buf[pos - 1]
+        if last == _OPEN_BRACE:
+            depth += 1
+        elif last == _CLOSE_BRACE:
+            depth -= 1
+            if depth == 0:
+                return pos, undefined_positions
+        else:
+            undefined_positions.append(pos - len(_UNDEFINED))
+
+
+def _replace_undefined(buf: bytes | bytearray, start: int, end: int, positions: list[int]) -> memoryview | bytes:
+    """把给定位置的undefined替换为null；没有需要替换的位置时返回原缓冲区切片"""
+    if not positions:
+        return memoryview(buf)[start:end]
+    view = memoryview(buf)
+    parts = []
+    prev = start
+    for pos in positions:
+        parts.append(view[prev:pos])
+        parts.append(_NULL)
+        prev = pos + len(_UNDEFINED)
+    parts.append(view[prev:end])
+    return b"".join(parts)
 
-    script_end = html.find('</script>', start_idx)
+
+def _buffer_of(view: memoryview) -> bytes | bytearray:
+    """返回覆盖整个bytes/bytearray的memoryview的底层对象，其余情况（切片等）才复制"""
+    obj = view.obj
+    if isinstance(obj, (bytes, bytearray)) and view.contiguous and view.nbytes == len(obj):
+        return obj
+    return bytes(view)
+
+
+def _locate_state_bounds(html: str | bytes | bytearray | memoryview) -> tuple[bytes | bytearray, int, int]:
+    """定位window.__INITIAL_STATE__对象的起点，返回 (缓冲区, 对象起始, 脚本结束)"""
+    if isinstance(html, str):
+        start_idx = html.find(STATE_MARKER.decode())
+        if start_idx == -1:
+            raise StateNotFoundError("无法找到window.__INITIAL_STATE__数据", "marker")
+        raw = html[start_idx:].encode("utf-8")
+        start_idx = 0
+    else:
+        raw = _buffer_of(html) if isinstance(html, memoryview) else html
+        start_idx = raw.find(STATE_MARKER)
+        if start_idx == -1:
+            raise StateNotFoundError("无法找到window.__INITIAL_STATE__数据", "marker")
+
+    script_end = raw.find(SCRIPT_END, start_idx)
     if script_end == -1:
-        script_end = len(html)
+        script_end = len(raw)
 
-    brace_count = 0
-    json_end = json_start
-    in_string = False
-    escape_next = False
-    in_single_quote = False
+    json_start = raw.find(b"{", start_idx, script_end)
+    if json_start == -1:
+        raise StateNotFoundError("无法找到JSON开始位置", "json_start")
 
-    search_end = min(script_end, len(html))
-    for i in range(json_start, search_end):
-        char = html[i]
+    return raw, json_start, script_end
 
-        if escape_next:
-            escape_next = False
-            continue
 
-        if char == '\\':
-            escape_next = True
-            continue
+def _locate_state(html: str | bytes | bytearray | memoryview) -> tuple[bytes | bytearray, int, int, list[int]]:
+    """定位window.__INITIAL_STATE__对象，返回 (缓冲区, 起始, 结束, undefined位置)"""
+    raw, json_start, script_end = _locate_state_bounds(html)
+    json_end, undefined_positions = _match_object(raw, json_start, script_end)
+    if json_end == -1:
+        raise StateNotFoundError("无法找到完整的JSON对象", "unbalanced")
 
-        if char == '"' and not escape_next and not in_single_quote:
-            in_string = not in_string
-            continue
+    return raw, json_start, json_end, undefined_positions
 
-        if char == "'" and not escape_next and not in_string:
-            in_single_quote = not in_single_quote
-            continue
 
-        if not in_string and not in_single_quote:
-            if char == '{':
-                brace_count += 1
-            elif char == '}':
-                brace_count -= 1
-                if brace_count == 0:
-                    json_end = i + 1
-                    break
+def find_initial_state(html: str | bytes | bytearray | memoryview) -> memoryview:
+    """定位window.__INITIAL_STATE__对象，返回其原始字节切片
+
+    传入bytes、bytearray或覆盖其全部内容的memoryview时直接在原缓冲区上切片，不产生复制；
+    传入str时只编码标记之后的部分。
+    """
+    raw, start, end, _ = _locate_state(html)
+    return memoryview(raw)[start:end]
 
-    if brace_count != 0:
-        raise Exception("无法找到完整的JSON对象")
 
-    json_str = html[json_start:json_end]
-    json_str = re.sub(r'\bundefined\b', 'null', json_str)
+def _decode_state_json(
+    buf: bytes | bytearray,
+    start: int,
+    end: int,
+    undefined_positions: list[int],
+    backend: str | JsonBackend | None = None,
+):
+    """把[start, end)范围内的对象（替换undefined后）解析为Python对象"""
+    json_backend = get_json_backend(backend)
+    json_bytes = _replace_undefined(buf, start, end, undefined_positions)
 
     try:
-        return json.loads(json_str)
-    except json.JSONDecodeError as e:
+        with _trace("decode") as span:
+            span.record(len(json_bytes), backend=json_backend.name)
+            return json_backend.loads(json_bytes)
+    except json_backend.errors as e:
+        json_str = bytes(json_bytes).decode("utf-8", errors="replace")
         error_pos = getattr(e, 'pos', 0)
         start_debug = max(0, error_pos - 200)
         end_debug = min(len(json_str), error_pos + 200)
-        error_msg = f"JSON解析失败: {e}\n错误位置: {error_pos}\n附近内容: {json_str[start_debug:end_debug]}"
-        raise Exception(error_msg)
+        snippet = json_str[start_debug:end_debug]
+        error_msg = f"JSON解析失败: {e}\n错误位置: {error_pos}\n附近内容: {snippet}"
+        raise StateDecodeError(error_msg, error_pos, snippet, json_backend.name) from e
+
+
+def extract_initial_state(html: str | bytes | bytearray | memoryview, backend: str | JsonBackend | None = None) -> dict:
+    """从HTML中提取window.__INITIAL_STATE__的JSON数据
+
+    字符串外的undefined在定位对象的同一遍扫描中记录并替换为null，字符串内容保持不变。
+    backend指定JSON后端，默认见get_json_backend。
+    """
+    with _trace("extract") as span:
+        raw, start, end, undefined_positions = _locate_state(html)
+        span.record(end - start, path="full")
+    return _decode_state_json(raw, start, end, undefined_positions, backend)
+
+
+# 对象第一层的键值遍历：键、值分隔符及各类值的跳过
+_MEMBER_KEY_RE = re.compile(rb'[\s,]*("[^"\\]*+(?:\\.[^"\\]*+)*+")\s*:\s*', re.DOTALL)
+_STRING_VALUE_RE = re.compile(_STRING_PATTERN, re.DOTALL)
+_LITERAL_VALUE_RE = re.compile(rb"[^,}\]\s]*")
+_NEXT_BRACKET_RE = re.compile(rb"""(?:[^"'\[\]]++|""" + _STRING_PATTERN + rb""")*+[\[\]]""", re.DOTALL)
+_OPEN_BRACKET = ord("[")
+NOTE_DATA_KEYS = ("noteData", "data", "noteData")
+NOTE_DATA_PATH = tuple(key.encode() for key in NOTE_DATA_KEYS)
+
+
+def _match_array(buf: bytes | bytearray, start: int, end: int) -> int:
+    """从start处的'['开始匹配方括号，返回数组结束位置（不含），未闭合返回-1"""
+    match_next = _NEXT_BRACKET_RE.match
+    depth = 1
+    pos = start + 1
+    while True:
+        m = match_next(buf, pos, end)
+        if m is None:
+            return -1
+        pos = m.end()
+        if buf[pos - 1] == _OPEN_BRACKET:
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return pos
+
+
+def _skip_value(buf: bytes | bytearray, start: int, end: int) -> int:
+    """跳过start处的一个JSON值，返回其结束位置，无法识别时返回-1"""
+    first = buf[start]
+    if first == _OPEN_BRACE:
+        return _match_object(buf, start, end)[0]
+    if first == _OPEN_BRACKET:
+        return _match_array(buf, start, end)
+    if first in b"\"'":
+        m = _STRING_VALUE_RE.match(buf, start, end)
+        return m.end() if m else -1
+    return _LITERAL_VALUE_RE.match(buf, start, end).end()
+
+
+def _find_member(buf: bytes | bytearray, obj_start: int, obj_end: int, key: bytes) -> int:
+    """在对象第一层中查找键，返回其值的起始位置，不存在时返回-1"""
+    quoted_key = b'"' + key + b'"'
+    pos = obj_start + 1
+    while pos < obj_end:
+        m = _MEMBER_KEY_RE.match(buf, pos, obj_end)
+        if m is None:
+            return -1
+        value_start = m.end()
+        if m.group(1) == quoted_key:
+            return value_start
+        pos = _skip_value(buf, value_start, obj_end)
+        if pos == -1:
+            return -1
+    return -1
+
+
+def extract_note_data(
+    html: str | bytes | bytearray | memoryview,
+    path: tuple[bytes, ...] = NOTE_DATA_PATH,
+    backend: str | JsonBackend | None = None,
+) -> dict:
+    """只定位并解析__INITIAL_STATE__中path指向的子对象（默认noteData.data.noteData）
+
+    路径上无关的兄弟store只做括号跳过，不做JSON解析。
+    """
+    with _trace("extract") as span:
+        raw, start, end = _locate_state_bounds(html)
+        span.record(path="targeted")
+        for key in path:
+            value_start = _find_member(raw, start, end, key)
+            if value_start == -1 or raw[value_start] != _OPEN_BRACE:
+                raise NoteStructureError("无法找到笔记数据，JSON结构可能不同", tuple(k.decode() for k in path))
+            start = value_start
+            end, undefined_positions = _match_object(raw, start, end)
+            if end == -1:
+                raise StateNotFoundError("无法找到完整的JSON对象", "unbalanced")
+        span.record(end - start)
+    return _decode_state_json(raw, start, end, undefined_positions, backend)
 
 
 def clean_topic_tags(text: str) -> str:
@@ -165,10 +2236,19 @@ def parse_note_data(data: dict) -> dict:
     # 统一使用 noteData.data.noteData 路径
     try:
         note_data = data["noteData"]["data"]["noteData"]
-        user_data = note_data.get("user", {})
     except (KeyError, TypeError):
-        raise Exception("无法找到笔记数据，JSON结构可能不同")
+        raise NoteStructureError("无法找到笔记数据，JSON结构可能不同", NOTE_DATA_KEYS)
+
+    return parse_note_fields(note_data)
 
+
+def parse_note_fields(note_data: dict) -> dict:
+    """从noteData.data.noteData子对象中提取所需信息"""
+    # 已删除或不可见的笔记该字段通常为undefined/null
+    if not isinstance(note_data, dict):
+        raise NoteStructureError("笔记数据缺失或不是对象，笔记可能已删除或不可见", NOTE_DATA_KEYS)
+
+    user_data = note_data.get("user", {})
     note_type = note_data.get("type", "normal")
     title = note_data.get("title", "")
     desc = note_data.get("desc", "")
@@ -242,11 +2322,100 @@ def parse_note_data(data: dict) -> dict:
 # 解析函数
 # ============================================================================
 
-async def parse_xhs_link(input_url: str) -> dict:
-    """解析小红书链接（主函数）"""
+async def parse_xhs_link(input_url: str, client: XhsClient | None = None, deadline: float | None = None) -> dict:
+    """解析小红书链接（主函数）
+
+    传入client时复用其连接池；未传入时为本次调用创建临时会话。
+    deadline为重定向和页面抓取两个阶段（含重试）共用的总时限（秒），为空时使用client.deadline。
+    """
+    async with _client_scope(client) as c:
+        return await _parse_one(input_url, c, deadline)
+
+
+async def parse_many(
+    urls: Iterable[str],
+    concurrency: int = 10,
+    client: XhsClient | None = None,
+    deadline: float | None = None,
+) -> AsyncIterator[tuple[str, dict | Exception]]:
+    """批量解析链接，按完成顺序产出 (输入URL, 结果或异常)
+
+    同时进行的解析数不超过concurrency；单个链接失败时产出其异常而不中断整批。
+    urls按需迭代，未产出的结果不会无限堆积。deadline为每个链接各自的总时限。
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency必须大于0")
+
+    async def run_one(url: str) -> tuple[str, dict | Exception]:
+        try:
+            return url, await _parse_one(url, c, deadline)
+        except Exception as e:
+            return url, e
+
+    async with _client_scope(client) as c:
+        pending: set[asyncio.Task] = set()
+        try:
+            for url in urls:
+                if len(pending) >= concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield task.result()
+                pending.add(asyncio.ensure_future(run_one(url)))
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def _parse_one(input_url: str, client: XhsClient, deadline: float | None) -> dict:
+    """完成一次解析；客户端设置了指标时统计进行中的解析数、结果及各阶段"""
+    metrics = client.metrics
+    if metrics is None:
+        return await _parse_with_deadline(input_url, client, deadline)
+
+    metrics.parses_in_flight.inc()
+    try:
+        with trace_stages(metrics.observe):
+            result = await _parse_with_deadline(input_url, client, deadline)
+    except Exception as e:
+        metrics.parses.inc(outcome=type(e).__name__)
+        raise
+    finally:
+        metrics.parses_in_flight.dec()
+    metrics.parses.inc(outcome="ok")
+    return result
+
+
+async def _parse_with_deadline(input_url: str, client: XhsClient, deadline: float | None) -> dict:
+    """在总时限内完成一次解析，超时抛出stage为deadline的TimeoutStageError"""
+    if deadline is None:
+        deadline = client.deadline
+    if deadline is None:
+        return await _parse_with_client(input_url, client)
+
+    token = _deadline.set(asyncio.get_running_loop().time() + deadline)
+    try:
+        async with asyncio.timeout(deadline) as cm:
+            return await _parse_with_client(input_url, client)
+    except asyncio.TimeoutError as e:
+        if cm.expired():
+            raise TimeoutStageError("deadline", deadline, input_url) from e
+        raise
+    finally:
+        _deadline.reset(token)
+
+
+async def _parse_with_client(input_url: str, client: XhsClient) -> dict:
+    """使用给定客户端完成一次解析"""
     # 1. 判断是否为短链接，如果是则获取重定向URL
     if "xhslink.com" in input_url:
-        full_url = await get_redirect_url(input_url)
+        full_url = await resolve_short_link(input_url, client)
     else:
         full_url = input_url
         if not full_url.startswith("http://") and not full_url.startswith("https://"):
@@ -255,10 +2424,110 @@ async def parse_xhs_link(input_url: str) -> dict:
     # 2. 清理分享长链URL（删除source和xhsshare参数）
     full_url = clean_share_url(full_url)
 
-    # 3. 获取页面内容并解析
-    html = await fetch_page(full_url)
-    initial_state = extract_initial_state(html)
-    note_data = parse_note_data(initial_state)
+    # 3. 按笔记ID查询结果缓存及失败缓存
+    note_id = extract_note_id(full_url)
+    cache = client.result_cache if note_id else None
+    negative_cache = client.negative_cache if note_id else None
+
+    async def fetch_and_parse() -> dict:
+        try:
+            html, _ = await _fetch_body(full_url, client, client.stream)
+            if client.state_store is not None and note_id is not None:
+                await client.state_store.save(note_id, html)
+            note_data = parse_state_html(html, client.targeted, client.json_backend, note_id)
+        except XhsError as e:
+            kind = classify_failure(e)
+            if negative_cache is not None and kind is not None:
+                negative_cache.record(note_id, kind, e)
+            raise
+        if cache is not None:
+            await cache.set(note_id, note_data)
+        return note_data
+
+    metrics = client.metrics
+    if cache is not None:
+        cached, stale = await cache.lookup(note_id)
+        if metrics is not None:
+            metrics.cache("result", "miss" if cached is None else "stale" if stale else "hit")
+        if cached is not None:
+            # 陈旧结果直接返回，同时在后台刷新
+            if stale:
+                client._schedule_refresh(note_id, fetch_and_parse)
+            return cached
+    if negative_cache is not None:
+        try:
+            negative_cache.check(note_id)
+        except CachedFailureError:
+            if metrics is not None:
+                metrics.cache("negative", "hit")
+            raise
+        if metrics is not None:
+            metrics.cache("negative", "miss")
+
+    # 4. 获取页面内容并解析，同一笔记的并发请求合并为一次
+    if note_id is None:
+        return await fetch_and_parse()
+    return await client._page_flight.do(note_id, fetch_and_parse)
+
+
+def parse_state_html(
+    html: str | bytes | bytearray | memoryview,
+    targeted: bool = True,
+    backend: str | JsonBackend | None = None,
+    note_id: str | None = None,
+) -> dict:
+    """从页面（或__INITIAL_STATE__片段）解析出笔记信息
+
+    targeted为True时只解析noteData子树，定位失败再退回完整解析。
+    note_id只用于记录到parse阶段的追踪信息中。
+    """
+    if targeted:
+        try:
+            note_data = extract_note_data(html, backend=backend)
+        except PARSE_ERRORS:
+            pass
+        else:
+            return _traced_parse(parse_note_fields, note_data, note_id)
+
+    initial_state = extract_initial_state(html, backend)
+    return _traced_parse(parse_note_data, initial_state, note_id)
+
+
+def _traced_parse(parse, data: dict, note_id: str | None) -> dict:
+    """在parse阶段内执行parse(data)，记录笔记ID和笔记类型"""
+    with _trace("parse") as span:
+        span.record(note_id=note_id)
+        result = parse(data)
+        span.record(type=result["type"])
+        return result
+
+
+def _reparse_one(args: tuple[str, str, bool, str | None]) -> tuple[str, dict | Exception]:
+    """进程池工作函数：从存储读取并重新解析一篇笔记"""
+    directory, note_id, targeted, backend = args
+    try:
+        html = StateStore(directory).load(note_id)
+        if html is None:
+            raise StateNotFoundError(f"缓存中没有笔记: {note_id}", "not_stored")
+        return note_id, parse_state_html(html, targeted, backend, note_id)
+    except Exception as e:
+        return note_id, e
+
 
-    return note_data
+def reparse_from_cache(
+    store: StateStore,
+    note_ids: Iterable[str] | None = None,
+    processes: int | None = None,
+    targeted: bool = True,
+    backend: str | None = None,
+    chunksize: int = 16,
+) -> Iterator[tuple[str, dict | Exception]]:
+    """离线重新解析已保存的state片段，不发起网络请求
 
+    在进程池中并行执行，按输入顺序产出 (笔记ID, 结果或异常)。note_ids为空时处理存储中的全部笔记。
+    """
+    if note_ids is None:
+        note_ids = store.note_ids()
+    tasks = ((store.directory, note_id, targeted, backend) for note_id in note_ids)
+    with ProcessPoolExecutor(processes) as executor:
+        yield from executor.map(_reparse_one, tasks, chunksize=chunksize)
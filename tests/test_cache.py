@@ -0,0 +1,62 @@
+"""
+SqliteNoteCache缓冲写入测试
+"""
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import parser as xhs
+
+RESULT = {"type": "normal", "title": "标题", "image_urls": []}
+
+
+def test_timed_flush_visible_while_writing(tmp_path):
+    async def run():
+        cache = xhs.SqliteNoteCache(str(tmp_path / "cache.db"), flush_interval=0.01)
+        write_started = threading.Event()
+        release_write = threading.Event()
+        write_many = cache._write_many
+
+        def slow_write(items):
+            write_started.set()
+            release_write.wait(5)
+            write_many(items)
+
+        cache._write_many = slow_write
+        await cache.set("a", RESULT)
+        while not write_started.is_set():
+            await asyncio.sleep(0.01)
+        # 写入尚未完成时仍能从缓冲命中
+        assert (await cache.lookup("a"))[0] == RESULT
+        release_write.set()
+        await cache.flush()
+        assert cache._pending == {}
+        assert (await cache.lookup("a"))[0] == RESULT
+        await cache.close()
+
+    asyncio.run(run())
+
+
+def test_failed_timed_flush_raises_on_close(tmp_path):
+    async def run():
+        path = str(tmp_path / "cache.db")
+        cache = xhs.SqliteNoteCache(path, flush_interval=0.01)
+
+        def failing_write(items):
+            raise OSError("disk full")
+
+        cache._write_many = failing_write
+        await cache.set("a", RESULT)
+        await asyncio.sleep(0.05)
+        # 提交失败的条目留在缓冲中
+        assert (await cache.lookup("a"))[0] == RESULT
+        with pytest.raises(OSError):
+            await cache.close()
+
+    asyncio.run(run())
@@ -0,0 +1,56 @@
+"""
+XhsClient请求路径测试
+通过base_urls把请求导向本地服务
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import parser as xhs
+
+
+async def slow(request):
+    await asyncio.sleep(1)
+    return web.Response(text="")
+
+
+async def run_with_timeouts(input_url: str, timeouts: xhs.StageTimeouts):
+    app = web.Application()
+    app.router.add_get("/o/{code}", slow)
+    app.router.add_get("/explore/{note_id}", slow)
+    server = TestServer(app)
+    await server.start_server()
+    base = f"http://127.0.0.1:{server.port}"
+    try:
+        client = xhs.XhsClient(retry=None, timeouts=timeouts, base_urls={"xhslink.com": base, "www.xiaohongshu.com": base})
+        async with client:
+            return await xhs.parse_xhs_link(input_url, client)
+    finally:
+        await server.close()
+
+
+@pytest.mark.parametrize("input_url, stage", [
+    ("http://xhslink.com/o/abc", "redirect"),
+    ("https://www.xiaohongshu.com/explore/6911c27f0000000003018875", "first_byte"),
+])
+def test_timeout_reports_original_url(input_url, stage):
+    timeouts = xhs.StageTimeouts(redirect=0.05, first_byte=0.05)
+    with pytest.raises(xhs.TimeoutStageError) as info:
+        asyncio.run(run_with_timeouts(input_url, timeouts))
+    assert info.value.stage == stage
+    assert info.value.url == input_url
+
+
+def test_default_retry_policy_not_shared():
+    first, second = xhs.XhsClient(), xhs.XhsClient()
+    assert first.retry is not second.retry
+    first.retry.max_attempts = 10
+    assert second.retry.max_attempts == xhs.RetryPolicy().max_attempts
+    assert xhs.XhsClient(retry=None).retry is None
@@ -0,0 +1,146 @@
+"""
+__INITIAL_STATE__定位与解析测试
+覆盖字符串中的干扰字符、undefined替换以及定向解析退回完整解析的路径
+"""
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import parser as xhs
+
+# 字符串内的干扰字符：括号、转义引号、单引号、反斜杠和字面undefined
+TRICKY = (
+    '"a } b ] c { d [ e"',
+    '"转义 \\" 引号 \\"} 结尾"',
+    '"it\'s 小红书\'s \'单引号\' 和落单的\'"',
+    '"反斜杠结尾\\\\"',
+    '"undefined"',
+    '"值是undefined, 不是null}"',
+)
+
+
+def page(state: str, tail: str = "") -> str:
+    return (
+        "<html><head><script>window.__SETUP__={a:'}'}</script></head><body>"
+        f"<script>window.__INITIAL_STATE__={state}{tail}</script>"
+        "<script>window.__SSR__=true</script></body></html>"
+    )
+
+
+def note_state(note: str = '{"type":"normal","title":"标题","imageList":[{"url":"//img/1"}]}', extra: str = "") -> str:
+    return '{"feed":{"items":[' + ",".join(TRICKY) + '],"cursor":undefined}' + extra + ',"noteData":{"data":{"noteData":' + note + '}}}'
+
+
+@pytest.mark.parametrize("text", TRICKY)
+def test_match_object_skips_strings(text):
+    buf = ('{"k":' + text + ',"n":{"x":[1,{}]}} trailing}').encode()
+    end, positions = xhs._match_object(buf, 0, len(buf))
+    assert buf[:end] == ('{"k":' + text + ',"n":{"x":[1,{}]}}').encode()
+    assert positions == []
+
+
+def test_match_object_reports_bare_undefined_only():
+    buf = b'{"a":undefined,"b":"undefined","c":[undefined, "x undefined"],"d":{"e":undefined}}'
+    end, positions = xhs._match_object(buf, 0, len(buf))
+    assert end == len(buf)
+    assert positions == [buf.index(b":undefined") + 1, buf.index(b"[undefined") + 1, buf.index(b'"e":undefined') + 4]
+
+
+def test_match_object_unbalanced():
+    buf = b'{"a":{"b":"}}}"}'
+    assert xhs._match_object(buf, 0, len(buf))[0] == -1
+
+
+@pytest.mark.parametrize("tail", ["", ";", "  ;\n"])
+@pytest.mark.parametrize("as_type", [str, bytes, bytearray, memoryview])
+def test_extract_initial_state(as_type, tail):
+    html = page(note_state(), tail)
+    data = html if as_type is str else as_type(html.encode())
+    state = xhs.extract_initial_state(data)
+
+    assert state["feed"]["items"] == [json.loads(text) for text in TRICKY]
+    assert state["feed"]["cursor"] is None
+    assert state["noteData"]["data"]["noteData"]["title"] == "标题"
+
+
+def test_undefined_replaced_only_outside_strings():
+    state = xhs.extract_initial_state(page('{"a":undefined,"s":"undefined","l":[undefined,"undefined"],"u":"\\"undefined\\""}'))
+    assert state == {"a": None, "s": "undefined", "l": [None, "undefined"], "u": '"undefined"'}
+
+
+@pytest.mark.parametrize("as_view", [False, True])
+def test_find_initial_state_slices_input(as_view):
+    html = bytearray(page(note_state()).encode())
+    view = xhs.find_initial_state(memoryview(html) if as_view else html)
+    assert view.obj is html
+    assert bytes(view) == note_state().encode()
+
+
+def test_find_initial_state_partial_view():
+    html = ("padding" + page(note_state())).encode()
+    assert bytes(xhs.find_initial_state(memoryview(html)[7:])) == note_state().encode()
+
+
+@pytest.mark.parametrize("html, reason", [
+    ("<html></html>", "marker"),
+    ("<script>window.__INITIAL_STATE__=</script>", "json_start"),
+    ('<script>window.__INITIAL_STATE__={"a":"}"</script>', "unbalanced"),
+])
+def test_state_not_found(html, reason):
+    with pytest.raises(xhs.StateNotFoundError) as info:
+        xhs.extract_initial_state(html)
+    assert info.value.reason == reason
+
+
+def test_extract_note_data_skips_tricky_siblings():
+    extra = ',"search":{"keyword":"{\\"noteData\\":1}","noteData":"不是这个"}'
+    note = xhs.extract_note_data(page(note_state(extra=extra)).encode())
+    assert note == {"type": "normal", "title": "标题", "imageList": [{"url": "//img/1"}]}
+
+
+def test_extract_note_data_replaces_undefined_in_subtree():
+    note = xhs.extract_note_data(page(note_state('{"title":"undefined","lastUpdateTime":undefined}')))
+    assert note == {"title": "undefined", "lastUpdateTime": None}
+
+
+@pytest.mark.parametrize("value", ["undefined", "null"])
+def test_missing_note_data(value):
+    html = page(note_state(value))
+    with pytest.raises(xhs.NoteStructureError):
+        xhs.extract_note_data(html)
+    # 定向解析失败后退回完整解析，仍归类为结构错误
+    for targeted in (True, False):
+        with pytest.raises(xhs.NoteStructureError) as info:
+            xhs.parse_state_html(html, targeted)
+        assert xhs.classify_failure(info.value) == "parse_error"
+
+
+def extract_paths(html: str, targeted: bool) -> tuple[dict, list[tuple[str, str]]]:
+    events = []
+    with xhs.trace_stages(events.append):
+        result = xhs.parse_state_html(html, targeted)
+    return result, [(event.attrs["path"], event.outcome) for event in events if event.stage == "extract"]
+
+
+def test_parse_state_html_targeted_path():
+    result, paths = extract_paths(page(note_state()), targeted=True)
+    assert result["title"] == "标题"
+    assert result["image_urls"] == ["https://img/1"]
+    assert paths == [("targeted", "ok")]
+
+
+def test_parse_state_html_falls_back_to_full():
+    # 键中含转义时定向扫描无法匹配，完整解析后键名相同
+    html = page(note_state().replace('"noteData":{"data"', '"note\\u0044ata":{"data"'))
+    result, paths = extract_paths(html, targeted=True)
+    assert result["title"] == "标题"
+    assert paths == [("targeted", "NoteStructureError"), ("full", "ok")]
+
+    result, paths = extract_paths(html, targeted=False)
+    assert result["title"] == "标题"
+    assert paths == [("full", "ok")]
@@ -0,0 +1,132 @@
+"""
+OpenTelemetry阶段span测试
+使用SDK的InMemorySpanExporter收集span；未安装opentelemetry时跳过
+"""
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("opentelemetry.sdk")
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import StatusCode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import parser as xhs
+
+NOTE_ID = "6911c27f0000000003018875"
+PAGE = (
+    "<html><body><script>window.__INITIAL_STATE__={\"user\":{},\"noteData\":{\"data\":{\"noteData\":"
+    "{\"type\":\"normal\",\"title\":\"标题\",\"desc\":\"#话题[话题]#\",\"user\":{\"nickName\":\"n\",\"userId\":\"u\"},"
+    "\"time\":1700000000000,\"imageList\":[{\"url\":\"//img/1\"}],\"extra\":undefined}}}}</script></body></html>"
+)
+
+
+@pytest.fixture
+def otel():
+    exporter = InMemorySpanExporter()
+    tracer_provider = TracerProvider()
+    tracer_provider.add_span_processor(SimpleSpanProcessor(exporter))
+    xhs.enable_otel(tracer_provider)
+    yield tracer_provider, exporter
+    xhs.set_otel_tracer(None)
+
+
+def spans_by_name(exporter: InMemorySpanExporter) -> dict:
+    return {span.name: span for span in exporter.get_finished_spans()}
+
+
+def make_app() -> web.Application:
+    async def short_link(request):
+        raise web.HTTPFound(f"https://www.xiaohongshu.com/discovery/item/{NOTE_ID}?xsec_token=t")
+
+    async def note(request):
+        if request.match_info["note_id"] != NOTE_ID:
+            raise web.HTTPNotFound()
+        return web.Response(text=PAGE, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/o/{code}", short_link)
+    app.router.add_get("/discovery/item/{note_id}", note)
+    app.router.add_get("/explore/{note_id}", note)
+    return app
+
+
+async def run_against_server(func):
+    server = TestServer(make_app())
+    await server.start_server()
+    base = f"http://127.0.0.1:{server.port}"
+    try:
+        async with xhs.XhsClient(retry=None, base_urls={"xhslink.com": base, "www.xiaohongshu.com": base}) as client:
+            return await func(client)
+    finally:
+        await server.close()
+
+
+def test_disabled_by_default():
+    # 只安装API、未调用enable_otel时走空阶段，不创建span
+    code = "import parser; assert parser._trace('fetch') is parser._NOOP_STAGE"
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
+
+
+def test_extract_decode_parse_spans(otel):
+    _, exporter = otel
+    result = xhs.parse_state_html(PAGE, note_id=NOTE_ID)
+    assert result["title"] == "标题"
+
+    spans = spans_by_name(exporter)
+    assert {"xhs.extract", "xhs.decode", "xhs.parse"} <= spans.keys()
+    assert spans["xhs.extract"].attributes["xhs.path"] == "targeted"
+    assert spans["xhs.extract"].attributes["xhs.bytes"] > 0
+    assert spans["xhs.decode"].attributes["xhs.backend"] == xhs.get_json_backend().name
+    assert spans["xhs.parse"].attributes["xhs.note_id"] == NOTE_ID
+    assert spans["xhs.parse"].attributes["xhs.type"] == "normal"
+    assert all(span.status.status_code == StatusCode.UNSET for span in spans.values())
+
+
+def test_redirect_and_fetch_spans_nest_under_caller(otel):
+    tracer_provider, exporter = otel
+    tracer = tracer_provider.get_tracer("test")
+
+    async def parse(client):
+        with tracer.start_as_current_span("caller"):
+            return await xhs.parse_xhs_link("http://xhslink.com/o/abc", client)
+
+    result = asyncio.run(run_against_server(parse))
+    assert result["author_id"] == "u"
+
+    spans = spans_by_name(exporter)
+    caller = spans["caller"].context.span_id
+    redirect, fetch = spans["xhs.redirect"], spans["xhs.fetch"]
+    assert redirect.parent.span_id == caller
+    assert fetch.parent.span_id == caller
+    assert redirect.attributes["http.response.status_code"] == 302
+    assert fetch.attributes["http.response.status_code"] == 200
+    assert fetch.attributes["xhs.note_id"] == NOTE_ID
+    assert fetch.attributes["http.response.header.content-type"] == "text/html"
+    assert fetch.attributes["xhs.bytes"] >= len(PAGE.encode())
+    assert spans["xhs.parse"].attributes["xhs.note_id"] == NOTE_ID
+
+
+def test_failed_fetch_marks_span_error(otel):
+    _, exporter = otel
+
+    async def parse(client):
+        return await xhs.parse_xhs_link("https://www.xiaohongshu.com/explore/missing", client)
+
+    with pytest.raises(xhs.HttpStatusError):
+        asyncio.run(run_against_server(parse))
+
+    fetch = spans_by_name(exporter)["xhs.fetch"]
+    assert fetch.status.status_code == StatusCode.ERROR
+    assert fetch.attributes["http.response.status_code"] == 404
+    assert any(event.name == "exception" for event in fetch.events)
@@ -0,0 +1,117 @@
+"""
+熔断器与对冲请求测试
+覆盖熔断器的代数处理和对冲请求被取消时的清理
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import parser as xhs
+
+
+def open_breaker(**kwargs) -> xhs.CircuitBreaker:
+    """返回一个已打开、可立即进入half_open的熔断器"""
+    breaker = xhs.CircuitBreaker(min_requests=2, failure_rate=0.5, open_duration=0.0, **kwargs)
+    for _ in range(2):
+        breaker.after_request(breaker.before_request("h"), False)
+    assert breaker.state == xhs.CIRCUIT_OPEN
+    return breaker
+
+
+def test_stale_success_does_not_close_half_open():
+    breaker = xhs.CircuitBreaker(min_requests=2, failure_rate=0.5, open_duration=0.0, success_threshold=1)
+    stale = breaker.before_request("h")
+    for _ in range(2):
+        breaker.after_request(breaker.before_request("h"), False)
+    probe = breaker.before_request("h")
+    assert breaker.state == xhs.CIRCUIT_HALF_OPEN
+
+    # 打开前放行的请求此时成功，不算探测成功，也不释放探测名额
+    breaker.after_request(stale, True)
+    assert breaker.state == xhs.CIRCUIT_HALF_OPEN
+    with pytest.raises(xhs.CircuitOpenError):
+        breaker.before_request("h")
+
+    breaker.after_request(probe, True)
+    assert breaker.state == xhs.CIRCUIT_CLOSED
+
+
+def test_stale_failure_does_not_reopen_half_open():
+    breaker = open_breaker(success_threshold=1)
+    probe = breaker.before_request("h")
+    stale = probe - 1
+    breaker.after_request(stale, False)
+    assert breaker.state == xhs.CIRCUIT_HALF_OPEN
+    breaker.after_request(probe, True)
+    assert breaker.state == xhs.CIRCUIT_CLOSED
+
+
+def test_stale_results_not_counted_after_close():
+    breaker = open_breaker(success_threshold=1)
+    probe = breaker.before_request("h")
+    breaker.after_request(probe, True)
+    assert breaker.state == xhs.CIRCUIT_CLOSED
+
+    # 半开期间的探测结果晚到，不计入关闭后的失败率
+    breaker.after_request(probe, False)
+    breaker.after_request(breaker.before_request("h"), False)
+    assert breaker.state == xhs.CIRCUIT_CLOSED
+
+
+def test_half_open_failure_reopens():
+    breaker = open_breaker()
+    breaker.after_request(breaker.before_request("h"), False)
+    assert breaker.state == xhs.CIRCUIT_OPEN
+
+
+async def run_cancelled_hedge(delay: float, cancel_after: float) -> tuple[int, list[asyncio.Task]]:
+    """取消调用方，返回其结束时仍占用的限流名额和已发出的请求任务"""
+    limiter = xhs.HostLimiter(rate=1000, max_concurrency=4)
+    policy = xhs.HedgePolicy(initial_delay=delay, max_extra_load=1.0)
+    attempts = []
+
+    async def attempt(headers_received):
+        attempts.append(asyncio.current_task())
+        async with limiter:
+            await asyncio.sleep(3600)
+
+    caller = asyncio.ensure_future(xhs._hedged(policy, attempt))
+    await asyncio.sleep(cancel_after)
+    caller.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+    return limiter.in_flight, attempts
+
+
+@pytest.mark.parametrize("delay, cancel_after, attempt_count", [
+    (10.0, 0.02, 1),  # 等待对冲期间被取消
+    (0.01, 0.05, 2),  # 对冲请求已发出后被取消
+])
+def test_cancelled_hedge_releases_attempts(delay, cancel_after, attempt_count):
+    in_flight, attempts = asyncio.run(run_cancelled_hedge(delay, cancel_after))
+    assert len(attempts) == attempt_count
+    assert in_flight == 0
+    assert all(task.cancelled() for task in attempts)
+
+
+def test_hedge_returns_first_success():
+    async def run():
+        policy = xhs.HedgePolicy(initial_delay=0.01, max_extra_load=1.0)
+        started = []
+
+        async def attempt(headers_received):
+            started.append(headers_received)
+            if headers_received is not None:
+                await asyncio.sleep(3600)
+            return "hedge"
+
+        return await xhs._hedged(policy, attempt), started, policy
+
+    result, started, policy = asyncio.run(run())
+    assert result == "hedge"
+    assert len(started) == 2 and policy.hedges == 1